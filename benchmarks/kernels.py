@@ -0,0 +1,265 @@
+# Micro-benchmarks of the numerical kernels behind the notebooks, imported
+# from the libraries in src/ and from lowtran/lowtran7.py without any widget.
+# Every kernel is timed on inputs from 10² to 10⁷ points (spectral samples,
+# spatial frequencies, radii or configurations) and reported as throughput
+# and as peak memory allocated during one call (tracemalloc).
+#
+#   python benchmarks/kernels.py --output ./build/kernels.json [kernel ...]
+#
+# Kernels whose intermediates grow faster than their input stop at a smaller
+# size (see KERNELS), which --max-size can lower further for a quick run.
+import argparse
+import functools
+import gzip
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import numpy as np
+
+
+# the libraries in src/, and the LOWTRAN driver as lowtran.lowtran7 (the
+# notebook src/lowtran7.py has the same module name)
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'src'))
+
+import atmosphere  # noqa: E402
+import imaging  # noqa: E402
+import radiometry  # noqa: E402
+from lowtran import lowtran7  # noqa: E402
+
+
+SIZES = [10**idx for idx in range(2, 8)]
+
+SPECTRAL_BANDS = [[3.0, 5.0], [8.0, 12.0]]
+
+# synthetic input files, removed on exit
+scratch = tempfile.TemporaryDirectory()
+
+
+def spectrum(n):
+    # Synthetic transmission spectrum on n ascending wavelengths (µm), stored
+    # as float32 like the LOWTRAN7 table
+    rng = np.random.default_rng(0)
+
+    return (np.linspace(0.2, 25.0, n), rng.uniform(size=n).astype(np.float32))
+
+
+def TAPE7(path, Ncases):
+    # LOWTRAN output of Ncases cases, repeating the two real cases of the
+    # sample used by the tests
+    sample = gzip.decompress((ROOT / 'tests' / 'data' / 'TAPE7.gz').read_bytes())
+    cases = [case + b' -9999.\n' for case in sample.split(b' -9999.\n')[:-1]]
+    path.write_bytes(b''.join(cases[idx % len(cases)] for idx in range(Ncases)))
+
+
+# Kernels: name -> (setup, largest size). setup(n) returns a callable running
+# the kernel once on inputs of about n points, and the exact number of points.
+
+def setup_planck(n):
+    wavelength = np.linspace(0.5, 30.0, n)
+
+    return (functools.partial(radiometry.blackbody_spectral_radiant_sterance, 500.0, wavelength), n)
+
+
+def setup_planck_integral(n):
+    # x = C2/(λT) across the split between the series and into the far tail
+    return (functools.partial(radiometry.planck_integral, np.linspace(0.0, 50.0, n)), n)
+
+
+def setup_band_radiant_sterance(method):
+    def setup(n):
+        temperature = np.linspace(200.0, 3000.0, n)
+
+        return (functools.partial(radiometry.band_radiant_sterance, temperature, SPECTRAL_BANDS, method=method), n)
+
+    return setup
+
+
+def setup_fractional_blackbody(n):
+    return (functools.partial(radiometry.fractional_blackbody, np.linspace(100.0, 100000.0, n)), n)
+
+
+def setup_mtf(kernel):
+    def setup(n):
+        freq = np.linspace(0.0, 0.25, n)
+
+        return ({
+            'optics_mtf': functools.partial(imaging.optics_mtf, 4.0, 4.0, freq),
+            'pixel_mtf': functools.partial(imaging.pixel_mtf, 20.0, freq),
+            'composite_mtf': functools.partial(imaging.composite_mtf, freq, ('diffraction', 'pixel', 'jitter', 'diffusion'), fnumber=4.0, xlambda=4.0, pitch=20.0, jitter=2.0, diffusion_length=10.0),
+        }[kernel], n)
+
+    return setup
+
+
+def setup_radial(kernel):
+    def setup(n):
+        uu = np.linspace(0.0, 20.0, n)
+
+        return ({
+            'airy_psf': functools.partial(imaging.airy_psf, uu),
+            'encircled_energy': functools.partial(imaging.encircled_energy, 4.0, 4.0, uu),
+            'encircled_energy_radius': functools.partial(imaging.encircled_energy_radius, 4.0, 4.0, uu/20),
+        }[kernel], n)
+
+    return setup
+
+
+def setup_blur_spot_diameter(n):
+    fnumber = np.linspace(1.0, 16.0, n)
+
+    return (functools.partial(imaging.blur_spot_diameter, fnumber, 4.0), n)
+
+
+def setup_ensquared_energy(n):
+    pitch = np.linspace(1.0, 100.0, n)
+    imaging.ensquared_energy(4.0, 4.0, pitch[:1])
+
+    return (functools.partial(imaging.ensquared_energy, 4.0, 4.0, pitch), n)
+
+
+def setup_figures_of_merit(n):
+    fnumber = np.linspace(1.0, 8.0, n)
+    pitch = np.linspace(2.0, 40.0, n)
+
+    return (functools.partial(imaging.figures_of_merit, fnumber, 4.0, pitch, terms=('diffraction', 'pixel', 'jitter'), jitter=2.0), n)
+
+
+def setup_cumulative_integral(n):
+    (xlambda, Tcoeff) = spectrum(n)
+
+    return (functools.partial(atmosphere.cumulative_integral, xlambda, Tcoeff), n)
+
+
+def setup_band_average(n):
+    # band averaging of a spectrum including its cumulative integral, as for
+    # a case seen for the first time
+    (xlambda, Tcoeff) = spectrum(n)
+
+    def band_average():
+        return atmosphere.band_average(xlambda, Tcoeff, atmosphere.cumulative_integral(xlambda, Tcoeff), SPECTRAL_BANDS)
+
+    return (band_average, n)
+
+
+def setup_band_weights(n):
+    (xlambda, Tcoeff) = spectrum(n)
+
+    return (functools.partial(atmosphere.band_weights, xlambda, SPECTRAL_BANDS), n)
+
+
+def setup_interpolate_optical_depth(n):
+    (xlambda, T_lo) = spectrum(n)
+    T_hi = T_lo**1.5
+
+    return (functools.partial(atmosphere.interpolate_optical_depth, T_lo, T_hi, 5.0, 10.0, 7.0), n)
+
+
+def setup_read_TAPE7(parser):
+    def setup(n):
+        # whole cases only, at least one
+        Ncases = max(n//lowtran7.Npts, 1)
+        path = pathlib.Path(scratch.name) / f'TAPE7-{Ncases}'
+        if not path.exists():
+            TAPE7(path, Ncases)
+
+        return (functools.partial(parser, path, Ncases), Ncases*lowtran7.Npts)
+
+    return setup
+
+
+KERNELS = {
+    'blackbody_spectral_radiant_sterance': (setup_planck, 10**7),
+    'planck_integral': (setup_planck_integral, 10**6),
+    'band_radiant_sterance[series]': (setup_band_radiant_sterance('series'), 10**6),
+    'band_radiant_sterance[table]': (setup_band_radiant_sterance('table'), 10**6),
+    'fractional_blackbody': (setup_fractional_blackbody, 10**7),
+    'optics_mtf': (setup_mtf('optics_mtf'), 10**7),
+    'pixel_mtf': (setup_mtf('pixel_mtf'), 10**7),
+    'composite_mtf': (setup_mtf('composite_mtf'), 10**7),
+    'airy_psf': (setup_radial('airy_psf'), 10**7),
+    'encircled_energy': (setup_radial('encircled_energy'), 10**7),
+    'encircled_energy_radius': (setup_radial('encircled_energy_radius'), 10**7),
+    'blur_spot_diameter': (setup_blur_spot_diameter, 10**7),
+    'ensquared_energy': (setup_ensquared_energy, 10**7),
+    'figures_of_merit': (setup_figures_of_merit, 10**6),
+    'cumulative_integral': (setup_cumulative_integral, 10**7),
+    'band_average': (setup_band_average, 10**7),
+    'band_weights': (setup_band_weights, 10**6),
+    'interpolate_optical_depth': (setup_interpolate_optical_depth, 10**7),
+    'read_TAPE7': (setup_read_TAPE7(lowtran7.read_TAPE7), 10**6),
+    'read_TAPE7[loadtxt]': (setup_read_TAPE7(lowtran7.read_TAPE7_loadtxt), 10**6),
+}
+
+
+def measure(function, points, repeat):
+    # Best time per call over `repeat` rounds of at least 0.2 s each, then the
+    # peak memory of one more call (allocations made by the setup excluded)
+    timer = timeit.Timer(function)
+    (number, _) = timer.autorange()
+    seconds = min(timer.repeat(repeat, number))/number
+
+    tracemalloc.start()
+    try:
+        function()
+        (_, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'points': points,
+        'seconds': seconds,
+        'throughput': points/seconds,
+        'peak_memory': peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the throughput and peak memory of the numerical kernels.')
+    parser.add_argument('--output', type=pathlib.Path, default=None, help='where to write the results (JSON)')
+    parser.add_argument('--max-size', type=int, default=SIZES[-1], help='largest input size, in points')
+    parser.add_argument('--repeat', type=int, default=3, help='timing rounds per size')
+    parser.add_argument('kernels', nargs='*', help=f'kernels to run (default: all): {", ".join(KERNELS)}')
+    args = parser.parse_args()
+    for name in args.kernels:
+        if name not in KERNELS:
+            parser.error(f'unknown kernel {name!r}')
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'kernels': {},
+    }
+    print(f'{"kernel":38s} {"points":>9s} {"time":>10s} {"throughput":>14s} {"peak memory":>12s} {"per point":>10s}')
+    for name in args.kernels or KERNELS:
+        (setup, largest) = KERNELS[name]
+        results['kernels'][name] = []
+        for size in SIZES:
+            if size > min(largest, args.max_size):
+                break
+
+            (function, points) = setup(size)
+            if results['kernels'][name] and results['kernels'][name][-1]['points'] == points:
+                continue
+
+            result = measure(function, points, args.repeat)
+            results['kernels'][name].append(result)
+            print(
+                f'{name:38s} {points:9d} {result["seconds"]*1e3:7.3f} ms '
+                f'{result["throughput"]/1e6:8.2f} Mpt/s {result["peak_memory"]/2**20:9.2f} MB '
+                f'{result["peak_memory"]/points:7.1f} B', flush=True,
+            )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
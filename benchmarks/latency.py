@@ -0,0 +1,277 @@
+# Widget-latency benchmark: loads the built notebooks headlessly (with the
+# ipympl backend, whose canvas is the widget the notebooks lay out and renders
+# with Agg), replays scripted sequences of control events through the same
+# observe()/on_event() callbacks the browser triggers, and records for every
+# event the time spent in the handlers (compute), drawing the figure (draw)
+# and serializing the widget messages sent to the browser (sync). The results
+# are written as JSON and compared against a stored baseline.
+#
+#   python benchmarks/latency.py --build ./build/ \
+#       --output ./build/benchmark.json --baseline ./benchmarks/baseline.json
+#
+# There is no running asyncio loop here, so throttled handlers and background
+# computations run synchronously and every event is measured in full.
+import argparse
+import itertools
+import json
+import os
+import pathlib
+import platform
+import sys
+import time
+
+import comm
+import matplotlib
+import numpy as np
+
+
+matplotlib.use('module://ipympl.backend_nbagg')
+
+
+class Probe():
+    # Replaces the comm used by the widgets and the draw_idle() of the figure
+    # canvas to account for the messages sent and the draws requested
+    def __init__(self):
+        self.reset()
+
+        probe = self
+
+        def publish_msg(self, msg_type, data=None, metadata=None, buffers=None, **keys):
+            t0 = time.perf_counter()
+            size = len(json.dumps({'msg_type': msg_type, 'data': data, 'metadata': metadata}, default=str))
+            size += sum(len(memoryview(xx).cast('B')) for xx in buffers or [])
+            probe.sync += time.perf_counter() - t0
+            probe.messages += 1
+            probe.bytes += size
+
+        comm.DummyComm.publish_msg = publish_msg
+
+    def reset(self):
+        self.sync = 0.0
+        self.messages = 0
+        self.bytes = 0
+        self.draw_requested = False
+
+    def attach(self, canvas):
+        def draw_idle(*args, **kwargs):
+            self.draw_requested = True
+
+        canvas.draw_idle = draw_idle
+
+    def measure(self, canvas, event):
+        self.reset()
+        t0 = time.perf_counter()
+        event()
+        t1 = time.perf_counter()
+        if self.draw_requested:
+            canvas.draw()
+        t2 = time.perf_counter()
+
+        return {
+            'compute': t1 - t0 - self.sync,
+            'draw': t2 - t1,
+            'sync': self.sync,
+            'messages': self.messages,
+            'bytes': self.bytes,
+            'drawn': self.draw_requested,
+        }
+
+
+def load_notebook(path):
+    # Runs the code cells of a notebook, without IPython magics, and returns
+    # its namespace
+    cells = json.loads(path.read_text())['cells']
+    source = '\n'.join(''.join(cell['source']) for cell in cells if cell['cell_type'] == 'code')
+    source = '\n'.join(line for line in source.splitlines() if not line.lstrip().startswith('%'))
+
+    namespace = {'__name__': path.stem}
+    exec(compile(source, str(path), 'exec'), namespace)
+
+    return namespace
+
+
+# Scenarios: notebook and a function of its namespace returning the events,
+# each a callable triggering one control like the browser would
+
+def slide(slider, values):
+    # numpy scalars are converted, as the sliders only accept Python floats
+    values = [xx.tolist() if isinstance(xx, np.ndarray | np.generic) else xx for xx in values]
+
+    return [lambda xx=xx: setattr(slider, 'value', xx) for xx in values]
+
+
+def select(widget, values, event='change'):
+    return [lambda xx=xx: widget.fire_event(event, xx) for xx in values]
+
+
+def lowtran7_cases(ns):
+    # All the cases of the table, in an order where consecutive cases differ
+    # by a single control, so every event shows a new case
+    transmission = ns['transmission']
+    controls = [
+        (ns['model'], [int(xx) for xx in transmission.models], 'model'),
+        (ns['haze'], [int(xx) for xx in transmission.haze_types], 'haze'),
+        (ns['altitude'], [float(xx) for xx in transmission.altitudes], 'altitude'),
+        (ns['range'], [float(xx) for xx in transmission.ranges], 'range'),
+    ]
+
+    cases = [[]]
+    for (widget, values, key) in controls:
+        cases = [
+            case + [xx]
+            for (idx, case) in enumerate(cases)
+            for xx in (values if idx % 2 == 0 else values[::-1])
+        ]
+
+    events = []
+    current = [ns['parameters'][key] for (widget, values, key) in controls]
+    for case in cases:
+        for ((widget, values, key), old, new) in zip(controls, current, case):
+            if old != new:
+                if widget is ns['range']:
+                    events += slide(widget, [new])
+                else:
+                    events += select(widget, [new])
+        current = case
+
+    return events
+
+
+SCENARIOS = {
+    'blackbody-temperature': ('blackbody', lambda ns: slide(ns['temperature'], np.arange(310, 2310, 10))),
+    'blackbody-band': ('blackbody', lambda ns: slide(
+        ns['spectral_bands_control_panel'].widget.children[0],
+        [[3.0, 5.0 + 0.1*idx] for idx in range(1, 51)],
+    )),
+    'lowtran7-cases': ('lowtran7', lowtran7_cases),
+    'lowtran7-resolution': ('lowtran7', lambda ns: select(ns['resolution'], [20.0, 50.0, 100.0, 200.0, 0.0]*4)),
+    'mtf-fnumber': ('mtf', lambda ns: slide(ns['fnumber'], np.round(np.arange(2.1, 8.0, 0.1), 1))),
+    'mtf-defocus': ('mtf', lambda ns: slide(ns['defocus'], np.round(np.arange(0.1, 5.1, 0.1), 1))),
+    'psf-diameter': ('psf', lambda ns: slide(
+        ns['optics_control_panel'].widget.children[0],
+        np.round(np.arange(1.1, 10.0, 0.1), 1),
+    )),
+    'optics-focal-length': ('optics', lambda ns: slide(
+        ns['optics_control_panel'].widget.children[1],
+        np.round(np.arange(2.1, 10.0, 0.1), 1),
+    )),
+    'optics-typing': ('optics', lambda ns: select(
+        ns['detector_format_control_panel'].widget.children[0],
+        ['1', '19', '192', '1920', '192', '19', '1', '12', '128', '1280']*5,
+        event='input',
+    )),
+    'figures-of-merit-jitter': ('figures-of-merit', lambda ns: slide(ns['jitter'], np.arange(0.5, 20.5, 0.5))),
+    'figures-of-merit-metric': ('figures-of-merit', lambda ns: select(
+        ns['metric'], list(itertools.islice(itertools.cycle(['Q', 'blur_spot', 'mtf50', 'ensquared_energy', 'mtf_nyquist']), 25)),
+    )),
+}
+
+
+def statistics(samples):
+    samples = np.asarray(samples)*1e3
+
+    return {
+        'median': float(np.median(samples)),
+        'p95': float(np.percentile(samples, 95)),
+        'max': float(np.max(samples)),
+    }
+
+
+def run_scenario(probe, ns, events):
+    canvas = ns['figure'].fig.canvas
+    probe.attach(canvas)
+
+    records = [probe.measure(canvas, event) for event in events]
+    result = {
+        'events': len(records),
+        'draws': sum(record['drawn'] for record in records),
+        'messages_per_event': float(np.mean([record['messages'] for record in records])),
+        'bytes_per_event': float(np.mean([record['bytes'] for record in records])),
+    }
+    for stage in ('compute', 'draw', 'sync'):
+        result[stage] = statistics([record[stage] for record in records])
+    result['total'] = statistics([record['compute'] + record['draw'] + record['sync'] for record in records])
+
+    return result
+
+
+def compare(results, baseline, tolerance, floor):
+    # Median and p95 of the total latency against the baseline; an increase
+    # counts as a regression beyond `tolerance` (relative) and `floor` (ms)
+    regressions = []
+    print(f'{"scenario":26s} {"median (ms)":>21s} {"p95 (ms)":>21s}')
+    for (name, result) in results['scenarios'].items():
+        if name not in baseline['scenarios']:
+            print(f'{name:26s} {"(no baseline)":>21s}')
+            continue
+
+        columns = []
+        for key in ('median', 'p95'):
+            (old, new) = (baseline['scenarios'][name]['total'][key], result['total'][key])
+            flag = ''
+            if new > old*(1 + tolerance) and new - old > floor:
+                regressions.append((name, key, old, new))
+                flag = ' !'
+            columns.append(f'{old:7.1f} -> {new:7.1f}{flag:2s}')
+        print(f'{name:26s} {columns[0]:>21s} {columns[1]:>21s}')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays control events through the built notebooks and measures their latency.')
+    parser.add_argument('--build', type=pathlib.Path, default=pathlib.Path('./build/'), help='directory of the built notebooks')
+    parser.add_argument('--output', type=pathlib.Path, default=None, help='where to write the results (JSON)')
+    parser.add_argument('--baseline', type=pathlib.Path, default=None, help='results to compare against (JSON)')
+    parser.add_argument('--update-baseline', action='store_true', help='write the results to the baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='relative increase counted as a regression')
+    parser.add_argument('--floor', type=float, default=5.0, help='increase in ms below which nothing counts as a regression')
+    parser.add_argument('scenarios', nargs='*', help=f'scenarios to run (default: all): {", ".join(SCENARIOS)}')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario {name!r}')
+
+    # the notebooks read their data relative to the build directory
+    build = args.build.resolve()
+    (output, baseline) = (path and path.resolve() for path in (args.output, args.baseline))
+    os.chdir(build)
+    sys.path.insert(0, str(build))
+
+    probe = Probe()
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'scenarios': {},
+    }
+    notebooks = {}
+    for name in args.scenarios or SCENARIOS:
+        (notebook, events) = SCENARIOS[name]
+        if notebook not in notebooks:
+            notebooks[notebook] = load_notebook(build/f'{notebook}.ipynb')
+
+        result = run_scenario(probe, notebooks[notebook], events(notebooks[notebook]))
+        results['scenarios'][name] = result
+        print(
+            f'{name:26s} {result["events"]:4d} events  '
+            f'compute {result["compute"]["median"]:7.1f}  draw {result["draw"]["median"]:7.1f}  '
+            f'sync {result["sync"]["median"]:5.2f} ms (median)  '
+            f'{result["messages_per_event"]:4.1f} msgs/event', flush=True,
+        )
+
+    if output:
+        output.write_text(json.dumps(results, indent=2) + '\n')
+
+    if baseline and args.update_baseline:
+        baseline.write_text(json.dumps(results, indent=2) + '\n')
+    elif baseline:
+        regressions = compare(results, json.loads(baseline.read_text()), args.tolerance, args.floor)
+        if regressions:
+            print(f'{len(regressions)} latency regression(s) beyond {args.tolerance:.0%} of the baseline')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
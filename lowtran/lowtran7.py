@@ -1,16 +1,25 @@
+import concurrent.futures
+import hashlib
+import os
+import pathlib
+import subprocess
 import sys
+import tempfile
 
 import matplotlib.pyplot as plt
 import numpy as np
 
 
+# Parameter grid, in table (C) order; altitudes (H1, km) vary fastest so that a
+# single altitude keeps the original (model, range, haze) layout. Extending any
+# axis only runs LOWTRAN for the cases that are not in the cache yet.
 models = np.array([1, 2, 3, 4, 5, 6])
 ranges = np.array([0.5, 1, 2, 5, 10, 20, 50])
 haze_types = np.array([0, 1, 2, 5])
+altitudes = np.array([0.0])
 
-parameters = np.array(np.meshgrid(models, ranges, haze_types, indexing='ij')).reshape((3, -1)).T
+parameters = np.array(np.meshgrid(models, ranges, haze_types, altitudes, indexing='ij')).reshape((4, -1)).T
 
-H1 = 0.0
 DV = 5
 
 assert ((50000-400) % DV) == 0
@@ -19,6 +28,20 @@ Npts = (50000-400)//DV + 1
 
 xnu = np.linspace(400, 50000, Npts)
 
+# Columns of the TAPE7 transmittance table (FORMAT F7.0,11F8.4,1PE10.3); the
+# last one is -ln(TOTAL), printed at full precision.
+columns = np.array([
+    'FREQ', 'TOTAL', 'H2O', 'CO2+', 'OZONE', 'TRACE', 'N2 CON', 'H2O CON',
+    'MOL SCAT', 'AER-HYD', 'HNO3', 'AER-HYD ABS', 'OPTICAL DEPTH',
+])
+
+# Parsed TAPE7 output of every case ever run, keyed on the SHA-256 of the
+# case's TAPE5 card set.
+cache = pathlib.Path('cache')
+
+# Output directory of the assembled table.
+table = pathlib.Path('lowtran7-table')
+
 
 def main():
     if len(sys.argv) == 2 and sys.argv[1] == 'prepare-TAPE5':
@@ -27,45 +50,200 @@ def main():
     if len(sys.argv) == 2 and sys.argv[1] == 'process-TAPE7':
         process_TAPE7()
 
+    if len(sys.argv) in (2, 3) and sys.argv[1] == 'generate':
+        generate(int(sys.argv[2]) if len(sys.argv) == 3 else os.cpu_count())
+
     if len(sys.argv) == 2 and sys.argv[1] == 'plot':
         plot()
 
 
 def prepare_TAPE5():
-    with open('TAPE5', 'w') as f:
-        for (idx, (MODEL, RANGE, IHAZE)) in enumerate(parameters):
-            IRPT = 0 if idx == len(parameters)-1 else 1
-            print((
-                f'{int(MODEL):5d}    1    0    0{" "*40}    0\n'
-                f'{int(IHAZE):5d}    0    0\n'
-                f'{H1:10.3f}{" "*20}{RANGE:10.3f}\n'
-                f'   400.000 50000.000{DV:10.3f}\n'
-                f'{IRPT:5d}'
-            ), file=f)
+    write_TAPE5('TAPE5', parameters)
+
+
+def TAPE5_cards(MODEL, RANGE, IHAZE, H1):
+    return (
+        f'{int(MODEL):5d}    1    0    0{" "*40}    0\n'
+        f'{int(IHAZE):5d}    0    0\n'
+        f'{H1:10.3f}{" "*20}{RANGE:10.3f}\n'
+        f'   400.000 50000.000{DV:10.3f}\n'
+    )
+
+
+def case_key(case):
+    return hashlib.sha256(TAPE5_cards(*case).encode()).hexdigest()
+
+
+def write_TAPE5(path, cases):
+    with open(path, 'w') as f:
+        for (idx, case) in enumerate(cases):
+            IRPT = 0 if idx == len(cases)-1 else 1
+            print(f'{TAPE5_cards(*case)}{IRPT:5d}', file=f)
 
 
 def process_TAPE7():
-    xlambda = 1e4/xnu
-    Tcoeff = np.zeros((len(parameters), Npts))
+    store(parameters, iter_TAPE7('TAPE7', len(parameters)))
+    save()
+
+
+# Lookup table mapping the bytes of a TAPE7 data line to their value as a
+# decimal digit (anything else counts as zero).
+_DIGITS = np.zeros(256, dtype=np.float32)
+_DIGITS[ord('0'):ord('9')+1] = np.arange(10)
+
+
+def _fixed_width_layout():
+    # Integer place value of every character of a 105-character data line within
+    # each field, and the number of decimals of each field; the E10.3 field is
+    # split into its mantissa here and its exponent (characters 102-104).
+    fields = [(0, 7, 0)] + [(7+8*idx, 8, 4) for idx in range(11)] + [(95, 6, 3)]
+
+    weights = np.zeros((105, len(columns)), dtype=np.float32)
+    for (idx, (offset, width, decimals)) in enumerate(fields):
+        point = offset + width - decimals - 1
+        weights[offset:point, idx] = 10.0**np.arange(point-offset-1+decimals, decimals-1, -1)
+        weights[point+1:offset+width, idx] = 10.0**np.arange(decimals-1, -1, -1)
+
+    return (weights, np.array([decimals for (_, _, decimals) in fields]))
+
+
+def iter_TAPE7(path, Ncases):
+    # Decode the fixed-width numeric block of each case (FORMAT F7.0,11F8.4,1PE10.3)
+    # with a couple of table lookups and a matrix product, instead of parsing it
+    # line by line; every field's digits are summed as exact integers and then
+    # scaled by a single division, so the result matches a correctly rounded
+    # text parse. The file is read one case at a time, and each case is yielded
+    # as an array of shape (Npts, len(columns)).
+    (weights, decimals) = _fixed_width_layout()
+
+    with open(path, 'rb') as f:
+        for _ in range(Ncases):
+            line = f.readline()
+            while b'  FREQ   TOTAL' not in line:
+                if not line:
+                    raise ValueError(f'{path}: fewer than {Ncases} cases')
+                line = f.readline()
+
+            lines = np.frombuffer(f.read(Npts*106), dtype=np.uint8).reshape((Npts, 106))[:, :105]
+
+            digits = np.take(_DIGITS, lines)
+            values = (digits @ weights).astype(float)
+            # only the exponent of the E10.3 field is ever negative in practice
+            minus = lines[:, :102] == ord('-')
+            signs = np.where(minus @ (weights[:102] != 0), -1, 1) if minus.any() else 1
+
+            exponent = digits[:, 103]*10 + digits[:, 104]
+            exponent = np.where(lines[:, 102] == ord('-'), -exponent, exponent) - decimals[-1]
+            values[:, :-1] /= 10.0**decimals[:-1]
+            values[:, -1] = np.where(exponent < 0, values[:, -1]/10.0**-np.minimum(exponent, 0), values[:, -1]*10.0**np.maximum(exponent, 0))
+
+            yield signs*values
+
 
-    with open('TAPE7', 'r') as f:
-        for idx in range(len(parameters)):
-            Tcoeff[idx] = np.loadtxt(f, skiprows=11, max_rows=Npts, usecols=(1,))
+def read_TAPE7(path, Ncases):
+    # All the cases of iter_TAPE7(), shape (Ncases, Npts, len(columns))
+    data = np.zeros((Ncases, Npts, len(columns)))
+    for (idx, case_data) in enumerate(iter_TAPE7(path, Ncases)):
+        data[idx] = case_data
+
+    return data
+
+
+def read_TAPE7_loadtxt(path, Ncases):
+    # Reference for read_TAPE7(), which it is tested and benchmarked against:
+    # one np.loadtxt per case, skipping the 11 lines of the case's header and
+    # the -9999. line that ends its table.
+    data = np.zeros((Ncases, Npts, len(columns)))
+
+    with open(path, 'r') as f:
+        for idx in range(Ncases):
+            data[idx] = np.loadtxt(f, skiprows=11, max_rows=Npts)
             f.read(8)
 
-    # for idx in range(len(data)):
-    #     print(np.interp(1000, xnu, data[idx]))
+    return data
 
-    np.savez('lowtran7.npz', xlambda=xlambda, Tcoeff=Tcoeff)
 
+def store(cases, data):
+    # Cache every case as soon as its data is available (data may be an
+    # iterator); each file is written under a temporary name and renamed, so
+    # that an interrupted run never leaves a truncated case in the cache.
+    cache.mkdir(exist_ok=True)
+    for (case, case_data) in zip(cases, data):
+        path = cache / f'{case_key(case)}.npz'
+        with open(path.with_suffix('.tmp'), 'wb') as f:
+            np.savez_compressed(f, columns=columns, data=case_data)
+        os.replace(path.with_suffix('.tmp'), path)
 
-def plot():
-    data = np.load('lowtran7.npz')
 
-    xlambda = data['xlambda']
-    Tcoeff = data['Tcoeff']
+def save():
+    # Assemble the table for the current grid from the cache, as uncompressed
+    # float32 .npy files sorted by ascending wavelength, so that the notebooks
+    # can memory-map them and only read the rows they use. Rows are streamed
+    # into the memory-mapped output, so the grid size is not bound by memory.
+    table.mkdir(exist_ok=True)
+    np.save(table / 'xlambda.npy', 1e4/xnu[::-1])
+    np.savez(table / 'grid.npz', models=models, ranges=ranges, haze_types=haze_types, altitudes=altitudes)
+
+    Tcoeff = np.lib.format.open_memmap(table / 'Tcoeff.npy', mode='w+', dtype=np.float32, shape=(len(parameters), Npts))
+    for (idx, case) in enumerate(parameters):
+        with np.load(cache / f'{case_key(case)}.npz') as case_data:
+            Tcoeff[idx] = case_data['data'][::-1, 1]
+    Tcoeff.flush()
+
+
+# Largest number of cases run by one LOWTRAN process, which bounds the
+# scratch TAPE7 (~1 MB per case) of each worker and the work lost if the run
+# is interrupted.
+SHARD_SIZE = 64
+
+
+def split_shards(cases, jobs):
+    # Contiguous shards of at most SHARD_SIZE cases, at least one per job
+    count = min(len(cases), max(jobs, -(-len(cases)//SHARD_SIZE)))
+
+    return np.array_split(cases, count) if count else []
+
+
+def run_shard(executable, scratch, cases):
+    # Run LOWTRAN over a subset of the cases in its own scratch directory,
+    # since the executable always reads and writes TAPE* in the working
+    # directory, and cache the cases one at a time as they are parsed.
+    with tempfile.TemporaryDirectory(dir=scratch) as directory:
+        directory = pathlib.Path(directory)
+        write_TAPE5(directory / 'TAPE5', cases)
+        subprocess.run([executable], cwd=directory, check=True, stdout=subprocess.DEVNULL)
+
+        store(cases, iter_TAPE7(directory / 'TAPE7', len(cases)))
+
+    return len(cases)
+
+
+def generate(jobs):
+    # Equivalent to prepare-TAPE5, ./lowtran7 and process-TAPE7, but only for
+    # the cases missing from the cache, with those split into contiguous shards
+    # run by a pool of `jobs` processes.
+    executable = pathlib.Path('lowtran7').resolve()
+    missing = np.array([case for case in parameters if not (cache / f'{case_key(case)}.npz').exists()])
+    shards = split_shards(missing, jobs)
+
+    print(f'{len(missing)} of {len(parameters)} cases to run in {len(shards)} shard(s)')
+
+    with tempfile.TemporaryDirectory() as scratch:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max(min(jobs, len(shards)), 1)) as executor:
+            futures = [executor.submit(run_shard, executable, scratch, shard) for shard in shards]
+            done = 0
+            for future in concurrent.futures.as_completed(futures):
+                done += future.result()
+                print(f'{done} of {len(missing)} cases done', flush=True)
+
+    save()
+
+
+def plot():
+    xlambda = np.load(table / 'xlambda.npy')
+    Tcoeff = np.load(table / 'Tcoeff.npy', mmap_mode='r')
 
-    idx = np.ravel_multi_index((4, 1), (len(models), len(ranges)))
+    idx = np.ravel_multi_index((4, 1, 0, 0), (len(models), len(ranges), len(haze_types), len(altitudes)))
 
     (fig, ax) = plt.subplots(constrained_layout=True)
 
@@ -80,4 +258,5 @@ def plot():
     fig.savefig('transmission.png')
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+import importlib.util
+import io
+import pathlib
+
+import numpy as np
+
+
+# Default parameter grid of the LOWTRAN7 table, mirroring lowtran/lowtran7.py;
+# tables that record their own grid override it.
+MODELS = np.array([1, 2, 3, 4, 5, 6])
+RANGES = np.array([0.5, 1, 2, 5, 10, 20, 50])
+HAZE_TYPES = np.array([0, 1, 2, 5])
+ALTITUDES = np.array([0.0])
+
+MODEL_NAMES = {
+    1: 'Tropical',
+    2: 'Midlatitude Summer',
+    3: 'Midlatitude Winter',
+    4: 'Subarctic Summer',
+    5: 'Subarctic Winter',
+    6: '1976 US Standard',
+}
+
+HAZE_NAMES = {
+    0: 'None',
+    1: 'Rural (23 km)',
+    2: 'Rural (5 km)',
+    3: 'Navy Maritime',
+    4: 'Maritime (23 km)',
+    5: 'Urban (5 km)',
+    6: 'Tropospheric (50 km)',
+    8: 'Advection Fog (0.2 km)',
+    9: 'Radiation Fog (0.5 km)',
+    10: 'Desert',
+}
+
+# Bulk export formats: file extension and MIME type. Parquet is offered only
+# when pyarrow is installed.
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'npz': ('npz', 'application/octet-stream'),
+    'float32': ('f32', 'application/octet-stream'),
+}
+if importlib.util.find_spec('pyarrow') is not None:
+    EXPORT_FORMATS['parquet'] = ('parquet', 'application/vnd.apache.parquet')
+
+
+def _grid_index(axis, values, name):
+    values = np.asarray(values)
+    idx = np.clip(np.searchsorted(axis, values), 0, len(axis)-1)
+    if not np.all(axis[idx] == values):
+        raise ValueError(f'{name} not in the LOWTRAN7 table: {values[axis[idx] != values]}')
+
+    return idx
+
+
+def band_weights(xlambda, spectral_bands):
+    # Weights W (Nbands × Npts) such that W @ f integrates the piecewise-linear
+    # interpolant of f(xlambda) over each band, including the partial bins at
+    # the band edges; xlambda must be ascending.
+    xlambda = np.asarray(xlambda, dtype=float)
+    spectral_bands = np.asarray(spectral_bands, dtype=float).reshape((-1, 2))
+
+    xl = xlambda[:-1]
+    xr = xlambda[1:]
+    hh = xr - xl
+    pp = np.clip(spectral_bands[:, [0]], xl, xr)
+    qq = np.clip(spectral_bands[:, [1]], xl, xr)
+
+    weights = np.zeros((len(spectral_bands), len(xlambda)))
+    weights[:, :-1] += ((xr - pp)**2 - (xr - qq)**2)/(2*hh)
+    weights[:, 1:] += ((qq - xl)**2 - (pp - xl)**2)/(2*hh)
+
+    return weights
+
+
+def cumulative_integral(xlambda, Tcoeff):
+    # Running trapezoid integral of Tcoeff over xlambda along the last axis,
+    # starting at zero, i.e. the exact integral of the piecewise-linear spectrum.
+    steps = np.diff(xlambda)*(Tcoeff[..., 1:] + Tcoeff[..., :-1])/2
+
+    return np.concatenate([np.zeros(np.shape(Tcoeff)[:-1] + (1,)), np.cumsum(steps, axis=-1)], axis=-1)
+
+
+def band_average(xlambda, Tcoeff, cumulative, spectral_bands):
+    # Average of the piecewise-linear spectrum over each band, from its
+    # cumulative integral: two searchsorted lookups per band plus the partial
+    # bins at either edge. Bands are clipped to the tabulated wavelengths.
+    # Tcoeff and cumulative have shape (..., Npts); the result (..., Nbands).
+    spectral_bands = np.clip(np.asarray(spectral_bands, dtype=float).reshape((-1, 2)), xlambda[0], xlambda[-1])
+
+    edges = spectral_bands.ravel()
+    idx = np.clip(np.searchsorted(xlambda, edges) - 1, 0, len(xlambda)-2)
+    dx = edges - xlambda[idx]
+    T_lo = Tcoeff[..., idx]
+    T_edge = T_lo + (Tcoeff[..., idx+1] - T_lo)*dx/(xlambda[idx+1] - xlambda[idx])
+    integral = (cumulative[..., idx] + dx*(T_lo + T_edge)/2).reshape(np.shape(Tcoeff)[:-1] + spectral_bands.shape)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (integral[..., 1] - integral[..., 0])/(spectral_bands[:, 1] - spectral_bands[:, 0])
+
+
+def slit_function(slit, fwhm, dv):
+    # Instrument line shape sampled every dv (cm⁻¹) and normalized to unit sum:
+    # a triangle or a Gaussian with the given full width at half maximum (cm⁻¹),
+    # the latter truncated at ±2 FWHM (≈ ±4.7σ).
+    if slit == 'triangular':
+        half = int(fwhm//dv)
+    elif slit == 'gaussian':
+        half = int(np.ceil(2*fwhm/dv))
+    else:
+        raise ValueError(f'Unknown slit: {slit!r}')
+
+    nu = dv*np.arange(-half, half+1)
+    if slit == 'triangular':
+        kernel = 1 - np.abs(nu)/fwhm
+    else:
+        kernel = np.exp(-4*np.log(2)*(nu/fwhm)**2)
+
+    return kernel/np.sum(kernel)
+
+
+def convolve_slit(Tcoeff, kernel):
+    # Convolution of every spectrum (last axis, uniform in wavenumber) with a
+    # symmetric kernel by FFT, batched over the leading axes. The spectra are
+    # padded with their end values, so the result keeps their length and does
+    # not roll off at the ends.
+    half = len(kernel)//2
+    padded = np.pad(Tcoeff, [(0, 0)]*(np.ndim(Tcoeff)-1) + [(half, half)], mode='edge')
+    nfft = 2**int(np.ceil(np.log2(padded.shape[-1] + len(kernel) - 1)))
+    convolved = np.fft.irfft(np.fft.rfft(padded, nfft)*np.fft.rfft(kernel, nfft), nfft)
+
+    return np.clip(convolved[..., 2*half:2*half+np.shape(Tcoeff)[-1]], 0, 1)
+
+
+def response_weights(xlambda, wavelength, response):
+    # Weights W (Nresponses × Npts) such that W @ T is the average of the
+    # spectrum T(xlambda) weighted by each detector response curve, ∫T·R dλ/∫R dλ,
+    # for responses sampled at `wavelength` (µm, ascending) and zero outside.
+    xlambda = np.asarray(xlambda, dtype=float)
+    response = np.atleast_2d(response)
+
+    steps = np.zeros(len(xlambda))
+    steps[:-1] += np.diff(xlambda)/2
+    steps[1:] += np.diff(xlambda)/2
+
+    weights = np.array([np.interp(xlambda, wavelength, rr, left=0, right=0) for rr in response])*steps
+    total = np.sum(weights, axis=-1, keepdims=True)
+    if np.any(total == 0):
+        raise ValueError(f'response zero over the LOWTRAN7 wavelengths: {np.flatnonzero(total == 0).tolist()}')
+
+    return weights/total
+
+
+def interpolate_optical_depth(T_lo, T_hi, range_lo, range_hi, range):
+    # Transmission at `range` from the spectra at the bracketing ranges, assuming
+    # per wavenumber a power law τ = τ_lo·(R/R_lo)ᵖ for the optical depth τ = -ln T:
+    # p = 1 is Beer–Lambert (continua, weak lines), p → 1/2 the strong-line limit
+    # of the Curtis–Godson band model. Bins where either τ is zero or infinite
+    # fall back to interpolating τ linearly in range.
+    (range_lo, range_hi, range) = (np.asarray(xx, dtype=float)[..., None] for xx in (range_lo, range_hi, range))
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        tau_lo = -np.log(T_lo)
+        tau_hi = -np.log(T_hi)
+        pp = np.log(tau_hi/tau_lo)/np.log(range_hi/range_lo)
+        tau = tau_lo*(range/range_lo)**pp
+        linear = tau_lo + (tau_hi - tau_lo)*(range - range_lo)/(range_hi - range_lo)
+
+    # opaque at both ranges (inf - inf) stays opaque; the tabulated ranges
+    # return their spectra unchanged
+    interpolated = np.exp(-np.nan_to_num(np.where(np.isfinite(tau), tau, linear), nan=np.inf))
+
+    return np.where(range == range_lo, T_lo, np.where(range == range_hi, T_hi, interpolated))
+
+
+class TransmissionTable():
+    def __init__(self, xlambda, Tcoeff, *, models=MODELS, ranges=RANGES, haze_types=HAZE_TYPES, altitudes=ALTITUDES):
+        self.xlambda = xlambda
+        self.Tcoeff = Tcoeff
+        self.models = models
+        self.ranges = ranges
+        self.haze_types = haze_types
+        self.altitudes = altitudes
+
+        self._cumulative = {}
+        self._resampled = {}
+
+    @classmethod
+    def load(cls, path=pathlib.Path() / 'lowtran7-table'):
+        # The lowtran7-table directory holds float32 .npy files already sorted
+        # by wavelength; Tcoeff is memory-mapped, so that kernels share the page
+        # cache and only the rows in use are read. Older lowtran7.npz files are
+        # stored on the ascending wavenumber grid and are flipped on load.
+        path = pathlib.Path(path)
+        if not path.is_dir():
+            data = np.load(path)
+            grid = {key: data[key] for key in ('models', 'ranges', 'haze_types', 'altitudes') if key in data}
+
+            return cls(data['xlambda'][::-1], data['Tcoeff'][:, ::-1], **grid)
+
+        try:
+            Tcoeff = np.load(path / 'Tcoeff.npy', mmap_mode='r')
+        except (OSError, ValueError):
+            # no mmap support (e.g. in the browser)
+            Tcoeff = np.load(path / 'Tcoeff.npy')
+
+        with np.load(path / 'grid.npz') as grid:
+            return cls(np.load(path / 'xlambda.npy'), Tcoeff, **grid)
+
+    @property
+    def shape(self):
+        return (len(self.models), len(self.ranges), len(self.haze_types), len(self.altitudes))
+
+    def case_index(self, model, range, haze, altitude=None):
+        # Row of Tcoeff for the given model number, range (km), IHAZE code and
+        # observer altitude (km, defaults to the lowest tabulated).
+        if altitude is None:
+            altitude = self.altitudes[0]
+
+        return np.ravel_multi_index((
+            _grid_index(self.models, model, 'model'),
+            _grid_index(self.ranges, range, 'range'),
+            _grid_index(self.haze_types, haze, 'haze'),
+            _grid_index(self.altitudes, altitude, 'altitude'),
+        ), self.shape)
+
+    @property
+    def cases(self):
+        # (model, range, haze, altitude) of every row of Tcoeff
+        grid = np.meshgrid(self.models, self.ranges, self.haze_types, self.altitudes, indexing='ij')
+
+        return {key: xx.ravel() for (key, xx) in zip(('model', 'range', 'haze', 'altitude'), grid)}
+
+    def cumulative(self, case_idx):
+        # Cumulative integral of the given rows of Tcoeff, computed once per
+        # case and cached.
+        case_idx = np.asarray(case_idx)
+        missing = [idx for idx in np.unique(case_idx).tolist() if idx not in self._cumulative]
+        if missing:
+            self._cumulative.update(zip(missing, cumulative_integral(self.xlambda, self.Tcoeff[missing])))
+
+        return np.reshape([self._cumulative[idx] for idx in case_idx.ravel().tolist()], case_idx.shape + (-1,))
+
+    def band_average(self, case_idx, spectral_bands):
+        # Band-average transmission of the given rows of Tcoeff, shape
+        # case_idx.shape + (Nbands,).
+        case_idx = np.asarray(case_idx)
+
+        return band_average(self.xlambda, self.Tcoeff[case_idx], self.cumulative(case_idx), spectral_bands)
+
+    def resample(self, slit='triangular', fwhm=20.0, step=None):
+        # Table of the transmission seen through an instrument with the given
+        # slit function (see slit_function), convolved in wavenumber for all
+        # cases at once and optionally decimated to `step` cm⁻¹, a multiple of
+        # the table spacing; cached per (slit, fwhm, step).
+        key = (slit, float(fwhm), step)
+        if key not in self._resampled:
+            nu = 1e4/self.xlambda
+            dv = abs(nu[1] - nu[0])
+            if not np.allclose(np.abs(np.diff(nu)), dv):
+                raise ValueError('LOWTRAN7 table is not uniform in wavenumber')
+
+            stride = 1 if step is None else int(round(step/dv))
+            if stride < 1 or not np.isclose(stride*dv, step if step is not None else dv):
+                raise ValueError(f'step must be a multiple of {dv:g} cm⁻¹')
+
+            Tcoeff = convolve_slit(np.asarray(self.Tcoeff, dtype=float), slit_function(slit, fwhm, dv))
+            self._resampled[key] = type(self)(
+                self.xlambda[::stride], Tcoeff[:, ::stride].astype(np.float32),
+                models=self.models, ranges=self.ranges, haze_types=self.haze_types, altitudes=self.altitudes,
+            )
+
+        return self._resampled[key]
+
+    def response_average(self, wavelength, response):
+        # Response-weighted transmission (see response_weights) of every case,
+        # shape (Ncases, Nresponses): one dot product per case.
+        return np.asarray(self.Tcoeff) @ response_weights(self.xlambda, wavelength, response).T
+
+    def spectrum(self, model, range, haze, altitude=None):
+        # Transmission spectrum at any range (km) between the tabulated ones,
+        # interpolated in optical depth between the bracketing ranges (exact at
+        # the tabulated ranges); the arguments broadcast and the result has
+        # shape broadcast + (Npts,).
+        if altitude is None:
+            altitude = self.altitudes[0]
+
+        (model, range, haze, altitude) = np.broadcast_arrays(model, np.asarray(range, dtype=float), haze, altitude)
+        if np.any((range < self.ranges[0]) | (range > self.ranges[-1])):
+            raise ValueError(f'range outside of the LOWTRAN7 table: {self.ranges[0]:g} to {self.ranges[-1]:g} km')
+
+        hi = np.clip(np.searchsorted(self.ranges, range), 1, len(self.ranges)-1)
+        (range_lo, range_hi) = (self.ranges[hi-1], self.ranges[hi])
+
+        return interpolate_optical_depth(
+            self.Tcoeff[self.case_index(model, range_lo, haze, altitude)],
+            self.Tcoeff[self.case_index(model, range_hi, haze, altitude)],
+            range_lo, range_hi, range,
+        )
+
+    def range_interpolation_error(self):
+        # Leave-one-out check of spectrum(): predict every interior tabulated
+        # range from its two neighbours, for all cases at once, and return the
+        # largest absolute transmission error for each of those ranges.
+        Tcoeff = np.moveaxis(np.reshape(self.Tcoeff, self.shape + (-1,)), 1, -2)
+
+        return np.array([
+            np.max(np.abs(interpolate_optical_depth(
+                Tcoeff[..., idx-1, :], Tcoeff[..., idx+1, :],
+                self.ranges[idx-1], self.ranges[idx+1], self.ranges[idx],
+            ) - Tcoeff[..., idx, :]))
+            for idx in np.arange(1, len(self.ranges)-1)
+        ])
+
+
+def _format_fixed(values, decimals):
+    # ASCII of '%.{decimals}f' % value for 0 ≤ value < 10 as uint8, shape values.shape + (decimals+2,).
+    # '%f' rounds the exact binary value, which np.rint of the scaled value
+    # matches except within the rounding error of the scaling from a decimal
+    # tie (e.g. 0.2500005 is slightly above it); those few values are
+    # formatted by Python instead.
+    values = np.asarray(values, dtype=float)
+    product = values*10**decimals
+    scaled = np.rint(product).astype(np.int64)
+    for idx in np.flatnonzero(np.abs(product - np.floor(product) - 0.5) < 1e-6):
+        scaled.flat[idx] = int(f'{values.flat[idx]:.{decimals}f}'.replace('.', ''))
+    digits = (scaled[..., None]//10**np.arange(decimals, -1, -1) % 10 + ord('0')).astype(np.uint8)
+
+    return np.concatenate([digits[..., :1], np.full(digits.shape[:-1] + (1,), ord('.'), dtype=np.uint8), digits[..., 1:]], axis=-1)
+
+
+def _case_name(model, range, haze, altitude):
+    return f'{MODEL_NAMES.get(model, model)} / {range:g} km / {HAZE_NAMES.get(haze, haze)} haze / {altitude:g} km'
+
+
+def _export_csv(xlambda, Tcoeff, cases, chunk_size=1024):
+    # The same text as np.savetxt with '%.4f' for the wavelength and '%.6f' for
+    # the transmission of every case (one column each), CRLF-terminated, but
+    # formatted for a block of chunk_size rows at a time with array arithmetic.
+    names = [_case_name(*case) for case in zip(*cases.values())]
+    yield ('Wavelength (um),' + ','.join(f'"{name}"' for name in names) + '\r\n').encode()
+
+    wavelengths = [f'{xx:.4f},'.encode() for xx in xlambda]
+    for lo in np.arange(0, len(xlambda), chunk_size):
+        cells = _format_fixed(np.clip(Tcoeff[:, lo:lo+chunk_size].T, 0, 1), 6)
+        rows = np.concatenate([cells, np.full(cells.shape[:-1] + (1,), ord(','), dtype=np.uint8)], axis=-1).reshape((len(cells), -1))
+        rows[:, -1] = ord('\r')
+        rows = np.concatenate([rows, np.full((len(rows), 1), ord('\n'), dtype=np.uint8)], axis=-1)
+
+        yield b''.join(wavelength + row.tobytes() for (wavelength, row) in zip(wavelengths[lo:lo+chunk_size], rows))
+
+
+def _export_npz(xlambda, Tcoeff, cases):
+    with io.BytesIO() as buffer:
+        np.savez(buffer, xlambda=xlambda, Tcoeff=np.asarray(Tcoeff, dtype=np.float32), **cases)
+        yield buffer.getvalue()
+
+
+def _export_float32(xlambda, Tcoeff, cases, chunk_size=64):
+    # Little-endian float32 (Ncases+1) × Npts array whose first row is the wavelength
+    yield np.asarray(xlambda, dtype='<f4').tobytes()
+    for lo in np.arange(0, len(Tcoeff), chunk_size):
+        yield np.asarray(Tcoeff[lo:lo+chunk_size], dtype='<f4').tobytes()
+
+
+def _export_parquet(xlambda, Tcoeff, cases):
+    import pyarrow
+    import pyarrow.parquet
+
+    names = [_case_name(*case) for case in zip(*cases.values())]
+    columns = {'Wavelength (um)': np.asarray(xlambda, dtype=np.float32)}
+    columns.update(zip(names, np.asarray(Tcoeff, dtype=np.float32)))
+
+    with io.BytesIO() as buffer:
+        pyarrow.parquet.write_table(pyarrow.table(columns), buffer)
+        yield buffer.getvalue()
+
+
+def export(format, xlambda, Tcoeff, cases):
+    # The spectra Tcoeff (Ncases × Npts) on the wavelengths xlambda, for the
+    # cases given as {'model': ..., 'range': ..., 'haze': ..., 'altitude': ...}
+    # arrays, serialized in one of EXPORT_FORMATS; yields the file as chunks of
+    # bytes, so the text formats never exist in memory all at once.
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {format!r}')
+
+    return {
+        'csv': _export_csv,
+        'npz': _export_npz,
+        'float32': _export_float32,
+        'parquet': _export_parquet,
+    }[format](xlambda, Tcoeff, cases)
@@ -9,101 +9,100 @@
 
 # %%
 # %matplotlib widget
-import colour
 import ipyvuetify as v
 import ipywidgets as widgets
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
-import scipy.integrate
 
 from controls import (
+    ComputeScheduler,
+    IncrementalFigure,
     MyFloatSlider,
     MyFloatRangeSlider,
+    Parameters,
     SpectralBandsControlPanel,
+    Throttle,
+    profiling_panel,
+)
+from radiometry import (
+    band_radiant_sterance,
+    blackbody_spectral_radiant_sterance,
+    fractional_blackbody,
 )
 
 
-parameters = {
+parameters = Parameters({
     'temperature': 300,
     'spectral_bands': [(3.0, 5.0), (8.0, 12.0)],
     'figure_xlim': [0.2, 30],
-}
+}, scheduler=ComputeScheduler())
+
+
+# fraction of the blackbody radiant sterance in each band
+@parameters.derived(names=['temperature', 'spectral_bands'])
+def fractions(temperature, spectral_bands):
+    return np.diff(fractional_blackbody(np.array(spectral_bands)*temperature), axis=-1)[:, 0]
+
+
+@parameters.derived(names=['temperature', 'spectral_bands'])
+def band_radiant_sterances(temperature, spectral_bands):
+    return band_radiant_sterance(temperature, spectral_bands, method='table')
 
 
 output = widgets.Output()
 
 
-class Figure():
+class Figure(IncrementalFigure):
     def __init__(self):
         (fig, ax) = plt.subplots()
 
-        fig.canvas.header_visible = False
-        fig.canvas.toolbar_visible = True
-        fig.canvas.toolbar_position = 'right'
-
-        self.fig = fig
         self.ax = ax
+        self.ax.set_xlabel('Wavelength (µm)')
+        self.ax.set_ylabel(R'Spectral Radiant Sterance (W cm$^{-2}$ µm$^{-1}$ sr$^{-1}$)')
+        self.ax.grid(True)
 
-        self.update()
+        super().__init__(fig)
 
         self.fig.tight_layout()
 
-    @property
-    def canvas(self):
-        return self.fig.canvas
-
     def update(self):
         self.plot()
 
-        self.ax.set_xlabel('Wavelength (µm)')
-        self.ax.set_ylabel(R'Spectral Radiant Sterance (W cm$^{-2}$ µm$^{-1}$ sr$^{-1}$)')
-
         self.ax.set_xlim(parameters['figure_xlim'])
+        self.autoscale(self.ax)
 
-        self.ax.grid(True)
+        self.draw()
 
-        self.fig.canvas.draw_idle()
+    def update_xlim(self):
+        self.ax.set_xlim(parameters['figure_xlim'])
+
+        self.draw()
 
     def plot(self):
         temperature = parameters['temperature']
 
-        self.ax.clear()
         xlambda = np.linspace(0.2, 30, 150)
-        self.ax.plot(xlambda, blackbody_spectral_radiant_sterance(temperature, xlambda), color='black')
+        self.line(self.ax, 'spectrum', xlambda, blackbody_spectral_radiant_sterance(temperature, xlambda), color='black')
+        fractions = parameters['fractions']
         for (idx, (lambda_min, lambda_max)) in enumerate(parameters['spectral_bands']):
             xlambda = np.linspace(lambda_min, lambda_max)
-            self.ax.fill_between(
+            self.fill_between(
+                self.ax, ('band', idx),
                 xlambda,
                 blackbody_spectral_radiant_sterance(temperature, xlambda),
-                label=f'Band #{idx+1}',
+                label=f'Band #{idx+1} ({fractions[idx]:.1%})',
                 color='none',
                 hatch='///',
                 edgecolor=f'C{idx}',
                 alpha=0.5
                 )
-        self.ax.legend()
+        self.legend(self.ax)
 
 
 class Table():
     def __init__(self):
-        self.widget = v.Html(tag='div', class_='d-flex flex-row', children=[])
-
-        self.update()
-
-    def update(self):
-        temperature = parameters['temperature']
-        spectral_bands = parameters['spectral_bands']
-
-        values = [
-            scipy.integrate.quad(
-                lambda x: blackbody_spectral_radiant_sterance(temperature, x),
-                lambda_min, lambda_max
-            )[0]
-            for (lambda_min, lambda_max) in spectral_bands
-        ]
-
-        table = v.DataTable(
+        self.table = v.DataTable(
             style_='width: 100%',
             hide_default_footer=True,
             disable_sort=True,
@@ -112,20 +111,23 @@ class Table():
                 {'text': 'Value', 'value': 'value'},
                 {'text': 'Units', 'value': 'units'},
             ],
-            items=[
-                {
-                    'parameter': f'Band #{idx+1} radiant sterance',
-                    'value': f'{value:g}',
-                    'units': 'W cm⁻² sr⁻¹',
-                }
-                for (idx, value) in enumerate(values)
-            ],
+            items=[],
         )
-        self.widget.children = [table]
+        self.widget = v.Html(tag='div', class_='d-flex flex-row', children=[self.table])
 
+        self.update()
 
-def blackbody_spectral_radiant_sterance(temperature, wavelength):
-    return colour.colorimetry.blackbody.blackbody_spectral_radiance(wavelength*1e-6, temperature)/1e6/1e4
+    def update(self):
+        values = parameters['band_radiant_sterances']
+
+        self.table.items = [
+            {
+                'parameter': f'Band #{idx+1} radiant sterance',
+                'value': f'{value:g}',
+                'units': 'W cm⁻² sr⁻¹',
+            }
+            for (idx, value) in enumerate(values)
+        ]
 
 
 plt.ioff()
@@ -133,6 +135,10 @@ plt.ioff()
 figure = Figure()
 table = Table()
 
+parameters.observe(figure.update, names=['temperature', 'spectral_bands', 'fractions'])
+parameters.observe(figure.update_xlim, names=['figure_xlim'])
+parameters.observe(table.update, names=['band_radiant_sterances'])
+
 
 temperature = MyFloatSlider(
     label='Temperature (K)',
@@ -154,21 +160,23 @@ figure_xlim = MyFloatRangeSlider(
 )
 
 
+# coalesces events while a control is dragged, at most one redraw per 100 ms
+throttle = Throttle(interval=0.1)
+
+
+@throttle
 def update_temperature(change):
     parameters.update({'temperature': change.new})
-    figure.update()
-    table.update()
 
 
+@throttle
 def update_wavelengths():
-    parameters['wavelengths'] = spectral_bands_control_panel.spectral_bands
-    figure.update()
-    table.update()
+    parameters.update({'spectral_bands': spectral_bands_control_panel.spectral_bands})
 
 
+@throttle
 def update_xlim(change):
     parameters.update({'figure_xlim': change.new})
-    figure.update()
 
 
 temperature.observe(update_temperature, names='value')
@@ -226,6 +234,7 @@ v.Container(fluid=True, children=[
     #         output
     #     ]),
     # ]),
+    *profiling_panel(),
 ])
 
 
@@ -1,4 +1,14 @@
+import abc
+import asyncio
+import bisect
+import collections.abc
+import concurrent.futures
 import functools
+import html
+import math
+import os
+import threading
+import time
 from typing import List, Tuple
 
 import ipyvuetify as v
@@ -37,6 +47,21 @@ class MyFloatRangeSlider(v.VuetifyTemplate):
         })
 
 
+class FileDownload(v.VuetifyTemplate):
+    template_file = './templates/file-download.vue'
+
+    def send_file(self, filename, mime, chunks, *, message_size=2**20):
+        # Streams the bytes in `chunks` to the browser as binary comm buffers of
+        # at most message_size bytes, where they are assembled into a Blob and
+        # saved as `filename`; nothing is base64-encoded or kept in the DOM.
+        self.send({'method': 'begin'})
+        for chunk in chunks:
+            chunk = memoryview(chunk).cast('B')
+            for lo in range(0, len(chunk), message_size):
+                self.send({'method': 'append'}, buffers=[chunk[lo:lo+message_size]])
+        self.send({'method': 'save', 'args': [filename, mime]})
+
+
 class WavelengthsControlPanel():
     def __init__(self, *, xlambda: List[float]=[3.0, 5.0], lambda_min=0.2, lambda_max=30):
         self.xlambda = xlambda
@@ -58,8 +83,10 @@ class WavelengthsControlPanel():
     def active_wavelengths(self):
         return sorted(self._active_wavelengths)
 
-    @property
+    @functools.cached_property
     def widget(self):
+        # built once, so the sliders and their observers are not duplicated
+        # when the panel is shown again
         sliders = [
             MyFloatSlider(
                 label=f'Wavelength #{idx+1} (µm)',
@@ -124,7 +151,7 @@ class SpectralBandsControlPanel():
     def active_spectral_bands(self):
         return sorted(self._active_spectral_bands)
 
-    @property
+    @functools.cached_property
     def widget(self):
         sliders = [
             MyFloatRangeSlider(
@@ -184,7 +211,7 @@ class OpticsControlPanel():
         setattr(self, parameter, change.new)
         self.on_change_handler()
 
-    @property
+    @functools.cached_property
     def widget(self):
         diameter = MyFloatSlider(
             label='Diameter (cm)',
@@ -224,6 +251,13 @@ class OpticsControlPanel():
 
 
 class DetectorFormatControlPanel():
+    # type and range of each text field
+    LIMITS = {
+        'Hdim': (int, 1, 12288),
+        'Vdim': (int, 1, 12288),
+        'pitch': (float, 2, 120),
+    }
+
     def __init__(self, *, Hdim: int=1280, Vdim: int=720, pitch: float=20.0):
         self.Hdim = Hdim
         self.Vdim = Vdim
@@ -232,18 +266,31 @@ class DetectorFormatControlPanel():
         self.on_change_handler = type(None)
 
     def update_parameters(self, parameter, widget, event, data):
-        setattr(self, parameter, data)
+        # The fields hold whatever is typed: empty, non-numeric and
+        # non-positive text is ignored, keeping the last valid value, and
+        # numbers are clamped to the range of the field
+        (kind, lo, hi) = self.LIMITS[parameter]
+        try:
+            value = float(data)
+        except (TypeError, ValueError):
+            return
+        if not math.isfinite(value) or value <= 0:
+            return
+
+        if kind is int:
+            value = round(value)
+        setattr(self, parameter, kind(min(max(value, lo), hi)))
         self.on_change_handler()
 
-    @property
+    @functools.cached_property
     def widget(self):
         Hdim = v.TextField(
             label='Horizontal Dimension (pixels)',
             type='number',
             value=self.Hdim,
             attributes={
-                'min': 1,
-                'max': 12288,
+                'min': self.LIMITS['Hdim'][1],
+                'max': self.LIMITS['Hdim'][2],
             }
         )
         Vdim = v.TextField(
@@ -251,8 +298,8 @@ class DetectorFormatControlPanel():
             type='number',
             value=self.Vdim,
             attributes={
-                'min': 1,
-                'max': 12288,
+                'min': self.LIMITS['Vdim'][1],
+                'max': self.LIMITS['Vdim'][2],
             }
         )
         pitch = v.TextField(
@@ -260,8 +307,8 @@ class DetectorFormatControlPanel():
             type='number',
             value=self.pitch,
             attributes={
-                'min': 2,
-                'max': 120,
+                'min': self.LIMITS['pitch'][1],
+                'max': self.LIMITS['pitch'][2],
             }
         )
 
@@ -283,3 +330,398 @@ class DetectorFormatControlPanel():
             'Vdim': self.Vdim,
             'pitch': self.pitch,
         })
+
+
+class Throttle():
+    # Coalesces bursts of widget events, e.g. while a slider is dragged or a
+    # number is typed. The first call of a decorated handler runs at once;
+    # further calls within `interval` seconds only record their arguments and
+    # the handler runs once more with the latest ones when the interval ends,
+    # so intermediate values are dropped and the handlers sharing a throttle
+    # recompute at most once per interval. The timer runs on the asyncio loop
+    # of the kernel; without a running loop (pyodide, or a notebook executed
+    # as a script) the handlers are called synchronously.
+    def __init__(self, interval: float=1/30):
+        self.interval = interval
+        self._pending = {}
+        self._timer = None
+
+    def __call__(self, handler):
+        if profiler is not None:
+            handler = profiler.wrap('event', handler)
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return handler(*args, **kwargs)
+
+            if self._timer is None:
+                self._timer = loop.call_later(self.interval, self._flush)
+                handler(*args, **kwargs)
+            else:
+                self._pending[handler] = (args, kwargs)
+
+        return wrapper
+
+    def _flush(self):
+        (pending, self._pending) = (self._pending, {})
+        if not pending:
+            self._timer = None
+            return
+
+        self._timer = asyncio.get_running_loop().call_later(self.interval, self._flush)
+        for (handler, (args, kwargs)) in pending.items():
+            handler(*args, **kwargs)
+
+
+def _changed(old, new):
+    # Values set again are compared, except for the same mutable object, which
+    # may have been modified in place (e.g. the lists shared with control panels)
+    if old is new:
+        return not isinstance(new, collections.abc.Hashable)
+    try:
+        return bool(old != new)
+    except ValueError:
+        return True
+
+
+class ComputeScheduler():
+    # Runs compute() on a worker thread from the asyncio loop of the kernel,
+    # so that comm messages keep being handled meanwhile, and then calls
+    # apply(result) back on the loop. A job superseded by a newer submit() is
+    # cancelled if it has not started yet, and its result is dropped
+    # otherwise. Without a running loop or threads (pyodide, or a notebook
+    # executed as a script) both run synchronously.
+    def __init__(self):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._future = None
+
+    def submit(self, compute, apply):
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, compute)
+        except RuntimeError:
+            apply(compute())
+            return
+
+        if self._future is not None:
+            self._future.cancel()
+        self._future = future
+
+        def done(future):
+            if future is not self._future or future.cancelled():
+                return
+
+            self._future = None
+            if future.exception() is not None:
+                loop.call_exception_handler({'message': 'Background computation failed', 'exception': future.exception()})
+                return
+
+            apply(future.result())
+
+        future.add_done_callback(done)
+
+
+class Parameters(dict):
+    # The parameters of a notebook, with the derived values computed from them
+    # and the views (figures, tables) that show them. Derived values are read
+    # like parameters; they are computed on first access and memoized until
+    # one of the names they depend on changes. update() only reruns the views
+    # that depend, directly or through derived values, on a changed parameter.
+    # With a ComputeScheduler, the derived values those views declare are
+    # computed in the background from a snapshot of the parameters, and the
+    # views run once they are ready, with the latest values.
+    def __init__(self, parameters=(), *, scheduler: ComputeScheduler=None):
+        super().__init__(parameters)
+        self.scheduler = scheduler
+        self._derived = {}
+        self._memo = {}
+        self._views = []
+        self._pending = set()
+
+    def derived(self, *, names: List[str]):
+        # Decorator declaring a derived value, named after the function, which
+        # is called with the values of `names`
+        def decorator(function):
+            self._derived[function.__name__] = (function if profiler is None else profiler.wrap('compute', function), names)
+            return function
+
+        return decorator
+
+    def observe(self, handler, *, names: List[str]):
+        if profiler is not None:
+            handler = profiler.wrap('view', handler)
+
+        self._views.append((handler, names, self.dependencies(names)))
+
+    def dependencies(self, names):
+        # The parameters that `names` depend on, through derived values
+        return set().union(*(
+            self.dependencies(self._derived[name][1]) if name in self._derived else {name}
+            for name in names
+        ))
+
+    def _evaluate(self, name, values, memo):
+        if name not in self._derived:
+            return values[name]
+
+        if name not in memo:
+            (function, names) = self._derived[name]
+            memo[name] = function(*(self._evaluate(xx, values, memo) for xx in names))
+
+        return memo[name]
+
+    def __missing__(self, name):
+        if name not in self._derived:
+            raise KeyError(name)
+
+        return self._evaluate(name, self, self._memo)
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def update(self, *args, **kwargs):
+        changed = {key for (key, value) in dict(*args, **kwargs).items() if key not in self or _changed(self[key], value)}
+        super().update(*args, **kwargs)
+        if not changed:
+            return
+
+        for name in [name for name in self._memo if self.dependencies([name]) & changed]:
+            del self._memo[name]
+
+        self._pending |= {idx for (idx, (handler, names, dependencies)) in enumerate(self._views) if dependencies & changed}
+        if self.scheduler is None:
+            self._apply(self._memo)
+            return
+
+        (values, memo) = (dict(self), dict(self._memo))
+        names = {name for idx in self._pending for name in self._views[idx][1] if name in self._derived}
+
+        def compute():
+            for name in names:
+                self._evaluate(name, values, memo)
+            return memo
+
+        self.scheduler.submit(compute, self._apply)
+
+    def _apply(self, memo):
+        self._memo.update(memo)
+        (pending, self._pending) = (self._pending, set())
+        for idx in sorted(pending):
+            self._views[idx][0]()
+
+
+class IncrementalFigure(abc.ABC):
+    # Base class for the notebook figures. Artists are created by the first
+    # update() and modified in place by the following ones through the helpers
+    # below, instead of clearing and rebuilding the axes on every event. The
+    # layout engine of the figure only runs when the size of the figure or the
+    # limits of some axes (and with them the tick labels) have changed.
+    def __init__(self, fig):
+        fig.canvas.header_visible = False
+        fig.canvas.toolbar_visible = True
+        fig.canvas.toolbar_position = 'right'
+
+        self.fig = fig
+        self.artists = {}
+        self._legends = {}
+        self._layout_engine = fig.get_layout_engine()
+        self._layout_state = None
+        fig.set_layout_engine('none')
+        fig.canvas.mpl_connect('resize_event', self.relayout)
+        if profiler is not None:
+            fig.canvas.draw = profiler.wrap('render', fig.canvas.draw, name=type(self).__name__)
+
+        self.update()
+
+    @property
+    def canvas(self):
+        return self.fig.canvas
+
+    @abc.abstractmethod
+    def update(self):
+        pass
+
+    def artist(self, key, create):
+        # The artist stored under key, created by create() the first time
+        if key not in self.artists:
+            self.artists[key] = create()
+
+        return self.artists[key]
+
+    def remove(self, key):
+        if key in self.artists:
+            self.artists.pop(key).remove()
+
+    def line(self, ax, key, x, y, **kwargs):
+        if key in self.artists:
+            self.artists[key].set_data(x, y)
+            self.artists[key].set(**kwargs)
+        else:
+            (self.artists[key],) = ax.plot(x, y, **kwargs)
+
+        return self.artists[key]
+
+    def fill_between(self, ax, key, x, y1, y2=0, **kwargs):
+        if key in self.artists:
+            self.artists[key].set_data(x, y1, y2)
+            self.artists[key].set(**kwargs)
+        else:
+            self.artists[key] = ax.fill_between(x, y1, y2, **kwargs)
+
+        return self.artists[key]
+
+    def image(self, ax, key, data, extent, **kwargs):
+        if key in self.artists:
+            self.artists[key].set_data(data)
+            self.artists[key].set_extent(extent)
+            self.artists[key].autoscale()
+            self.artists[key].set_clim(kwargs.get('vmin'), kwargs.get('vmax'))
+        else:
+            self.artists[key] = ax.imshow(data, extent=extent, **kwargs)
+
+        return self.artists[key]
+
+    def legend(self, ax, **kwargs):
+        # Rebuilds the legend of ax only when its labels have changed
+        labels = tuple(ax.get_legend_handles_labels()[1])
+        if self._legends.get(ax) != labels:
+            ax.legend(**kwargs)
+            self._legends[ax] = labels
+
+    def autoscale(self, *axes):
+        for ax in axes:
+            ax.relim()
+            ax.autoscale_view()
+
+    def _state(self):
+        return (tuple(self.fig.get_size_inches()), tuple((ax.get_xlim(), ax.get_ylim()) for ax in self.fig.axes))
+
+    def relayout(self, event=None):
+        if self._layout_engine is not None:
+            self._layout_engine.execute(self.fig)
+        self._layout_state = self._state()
+
+    def draw(self):
+        if self._state() != self._layout_state:
+            self.relayout()
+
+        self.canvas.draw_idle()
+
+
+class Profiler():
+    # Rolling latency histograms of the stages of the updates, per function:
+    # the event handlers (event), the derived values (compute), the views
+    # (view) and the rendering of the figures (render). Times are inclusive,
+    # e.g. an event handler run synchronously includes the views it triggers.
+    # The last `size` samples of each are kept and shown in a collapsible
+    # panel, refreshed at most once per second while it is open.
+    STAGES = ('event', 'compute', 'view', 'render')
+
+    # histogram bin edges (ms); the last bin is open-ended
+    EDGES = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, size: int=200):
+        self.size = size
+        self.samples = {}
+        self._timer = None
+
+    def wrap(self, stage, function, name=None):
+        key = (stage, name or getattr(function, '__qualname__', repr(function)))
+        samples = self.samples.setdefault(key, collections.deque(maxlen=self.size))
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                # derived values computed on the worker thread are shown by
+                # the views that follow them
+                samples.append(time.perf_counter() - t0)
+                if threading.current_thread() is threading.main_thread():
+                    self._schedule_refresh()
+
+        return wrapper
+
+    def _schedule_refresh(self):
+        if self._timer is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.refresh()
+            return
+
+        self._timer = loop.call_later(1.0, self._refresh)
+
+    def _refresh(self):
+        self._timer = None
+        self.refresh()
+
+    @functools.cached_property
+    def widget(self):
+        self._html = widgets.HTML()
+        panels = v.ExpansionPanels(v_model=None, children=[
+            v.ExpansionPanel(children=[
+                v.ExpansionPanelHeader(children=['Profiling']),
+                v.ExpansionPanelContent(children=[self._html]),
+            ]),
+        ])
+        panels.observe(lambda change: self.refresh(), names='v_model')
+
+        return panels
+
+    def refresh(self):
+        # nothing is sent to the browser while the panel is closed
+        if 'widget' not in self.__dict__ or self.widget.v_model is None:
+            return
+
+        self._html.value = self._table()
+
+    def _table(self):
+        rows = []
+        for stage in self.STAGES:
+            for ((key, name), samples) in list(self.samples.items()):
+                ms = sorted(1e3*xx for xx in list(samples))
+                if key != stage or not ms:
+                    continue
+
+                counts = [0]*(len(self.EDGES) + 1)
+                for xx in ms:
+                    counts[bisect.bisect(self.EDGES, xx)] += 1
+                bars = ''.join(' ▁▂▃▄▅▆▇█'[math.ceil(8*count/max(counts))] for count in counts)
+
+                rows.append(
+                    f'<tr><td>{stage}</td><td>{html.escape(name)}</td><td>{len(ms)}</td>'
+                    f'<td>{ms[len(ms)//2]:.1f}</td><td>{ms[int(0.95*(len(ms) - 1))]:.1f}</td><td>{ms[-1]:.1f}</td>'
+                    f'<td style="font-family: monospace; white-space: pre">{bars}</td></tr>'
+                )
+
+        if not rows:
+            return 'No updates yet'
+
+        return (
+            '<table style="width: 100%; text-align: left">'
+            '<tr><th>Stage</th><th>Function</th><th>Calls</th><th>Median (ms)</th><th>p95 (ms)</th><th>Max (ms)</th>'
+            f'<th>Histogram ({self.EDGES[0]:g} ms to {self.EDGES[-1]/1e3:g} s, log)</th></tr>'
+            + ''.join(rows) + '</table>'
+        )
+
+
+# Opt-in profiling of the updates: set NOTEBOOKS_PROFILE=1 in the environment
+# of the kernel (e.g. `NOTEBOOKS_PROFILE=1 voila ./build/`). Otherwise nothing
+# is wrapped, and the hooks above cost a single test when a notebook is built.
+profiler = Profiler() if os.environ.get('NOTEBOOKS_PROFILE') else None
+
+
+def profiling_panel():
+    # The rows to append to the layout of a notebook: the profiling panel when
+    # profiling is enabled, none otherwise
+    if profiler is None:
+        return []
+
+    return [v.Row(children=[v.Col(cols=12, md=12, children=[profiler.widget])])]
@@ -0,0 +1,257 @@
+# ---
+# jupyter:
+#   kernelspec:
+#     name: python3
+#     display_name: Python 3
+#     language: python
+# ---
+
+
+# %%
+# %matplotlib widget
+import functools
+
+import ipyvuetify as v
+import ipywidgets as widgets
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+import numpy as np
+
+from controls import (
+    ComputeScheduler,
+    IncrementalFigure,
+    MyFloatRangeSlider,
+    MyFloatSlider,
+    Parameters,
+    Throttle,
+    profiling_panel,
+)
+from imaging import (
+    figures_of_merit,
+)
+
+
+parameters = Parameters({
+    'metric': 'mtf_nyquist',
+    'wavelength': 4.0,
+    'fnumber': [1.0, 8.0],
+    'pitch': [2.0, 40.0],
+    'jitter': 0.0,
+}, scheduler=ComputeScheduler())
+
+METRICS = {
+    'Q': ('Q = Fλ/d', 1),
+    'blur_spot': ('Blur spot / pitch', 1),
+    'mtf_nyquist': ('MTF at Nyquist', 1),
+    'mtf50': ('MTF50 (lp/mm)', 1000),
+    'ensquared_energy': ('Ensquared energy', 1),
+}
+
+Npoints = 201
+
+
+output = widgets.Output()
+
+
+@functools.lru_cache(maxsize=8)
+def sweep(wavelength, fnumber, pitch, jitter):
+    fnumber = np.linspace(*fnumber, Npoints)
+    pitch = np.linspace(*pitch, Npoints)
+
+    return (fnumber, pitch, figures_of_merit(
+        fnumber[:, None], wavelength, pitch,
+        terms=('diffraction', 'pixel', 'jitter'),
+        jitter=jitter,
+    ))
+
+
+@parameters.derived(names=['wavelength', 'fnumber', 'pitch', 'jitter'])
+def results(wavelength, fnumber, pitch, jitter):
+    return sweep(wavelength, tuple(fnumber), tuple(pitch), jitter)
+
+
+class Figure(IncrementalFigure):
+    def __init__(self):
+        (fig, (ax, cax)) = plt.subplots(ncols=2, width_ratios=[20, 1], constrained_layout=True)
+
+        self.ax = ax
+        self.cax = cax
+
+        self.ax.set_xlabel('Pixel Pitch (µm)')
+        self.ax.set_ylabel('Optics f/#')
+
+        super().__init__(fig)
+
+    def update(self):
+        self.plot_metric()
+        self.plot_contours()
+
+        self.draw()
+
+    def plot_metric(self):
+        (fnumber, pitch, results) = parameters['results']
+        (label, scale) = METRICS[parameters['metric']]
+
+        # the grids are uniform, so the map is an image with cells centred on the samples
+        dpitch = (pitch[-1] - pitch[0])/(Npoints - 1)/2
+        dfnumber = (fnumber[-1] - fnumber[0])/(Npoints - 1)/2
+        extent = [pitch[0] - dpitch, pitch[-1] + dpitch, fnumber[0] - dfnumber, fnumber[-1] + dfnumber]
+        image = self.image(self.ax, 'metric', results[parameters['metric']]*scale, extent, cmap='viridis', origin='lower', aspect='auto', interpolation='nearest')
+        colorbar = self.artist('colorbar', lambda: self.fig.colorbar(image, cax=self.cax))
+        colorbar.set_label(label)
+
+        self.ax.set_xlim(extent[:2])
+        self.ax.set_ylim(extent[2:])
+        self.ax.set_title(f'λ = {parameters["wavelength"]:g} µm')
+
+    def plot_contours(self):
+        (fnumber, pitch, results) = parameters['results']
+
+        # contour sets cannot be updated in place
+        if 'contours' in self.artists:
+            self.artists['contours'].remove()
+        self.artists['contours'] = self.ax.contour(pitch, fnumber, results['Q'], levels=[0.5, 1, 2], colors='white', linestyles='dashed', linewidths=1)
+        self.ax.clabel(self.artists['contours'], fmt='Q=%g')
+
+
+plt.ioff()
+
+figure = Figure()
+
+# the Q contours do not depend on the metric shown
+parameters.observe(figure.plot_metric, names=['results', 'metric'])
+parameters.observe(figure.plot_contours, names=['results'])
+parameters.observe(figure.draw, names=['results', 'metric'])
+
+
+metric = v.Select(
+    label='Figure of Merit',
+    items=[{'text': label, 'value': key} for (key, (label, scale)) in METRICS.items()],
+    value=parameters['metric'],
+    )
+
+wavelength = MyFloatSlider(
+    label='Wavelength (µm)',
+    value=parameters['wavelength'],
+    min=0.5,
+    max=14,
+    step=0.1,
+    )
+
+fnumber = MyFloatRangeSlider(
+    label='Optics f/#',
+    value=parameters['fnumber'],
+    min=0.5,
+    max=16,
+    step=0.1,
+    )
+
+pitch = MyFloatRangeSlider(
+    label='Pixel Pitch (µm)',
+    value=parameters['pitch'],
+    min=1,
+    max=100,
+    step=1,
+    )
+
+jitter = MyFloatSlider(
+    label='Jitter (µm rms)',
+    value=parameters['jitter'],
+    min=0,
+    max=20,
+    step=0.5,
+    )
+
+
+# coalesces events while a control is dragged, at most one redraw per 300 ms
+throttle = Throttle(interval=0.3)
+
+
+@throttle
+@output.capture()
+def update_metric(widget, event, data):
+    parameters.update({'metric': data})
+
+
+@throttle
+def update_wavelength(change):
+    parameters.update({'wavelength': change.new})
+
+
+@throttle
+def update_fnumber(change):
+    parameters.update({'fnumber': change.new})
+
+
+@throttle
+def update_pitch(change):
+    parameters.update({'pitch': change.new})
+
+
+@throttle
+def update_jitter(change):
+    parameters.update({'jitter': change.new})
+
+
+metric.on_event('change', update_metric)
+wavelength.observe(update_wavelength, names='value')
+fnumber.observe(update_fnumber, names='value')
+pitch.observe(update_pitch, names='value')
+jitter.observe(update_jitter, names='value')
+
+
+v.Container(fluid=True, children=[
+    v.Col(cols=12, md=12, children=[widgets.HTML(value='<h1 style="text-align: center">Figures of Merit</h1>')]),
+    v.Row(children=[
+        v.Col(cols=12, md=6, children=[
+            v.Card(
+                class_='mb-4',
+                outlined=True,
+                children=[
+                    v.CardTitle(children=['Parameters']),
+                    v.CardText(children=[
+                        metric,
+                        wavelength,
+                        jitter,
+                    ]),
+            ]),
+            v.Card(
+                class_='mb-4',
+                outlined=True,
+                children=[
+                    v.CardTitle(children=['Design Space']),
+                    v.CardText(children=[
+                        fnumber,
+                        pitch,
+                    ]),
+            ]),
+        ]),
+        v.Col(cols=12, md=6, children=[
+            v.Card(
+                class_='mb-4',
+                outlined=True,
+                children=[
+                    v.CardTitle(children=['Figure']),
+                    v.CardText(children=[
+                        figure.canvas,
+                    ]),
+            ]),
+        ]),
+    ]),
+    # v.Row(children=[
+    #     v.Col(cols=12, md=12, children=[
+    #         output
+    #     ]),
+    # ]),
+    *profiling_panel(),
+])
+
+
+# %% [markdown]
+"""
+## Description
+
+This notebook maps system figures of merit over a grid of optics f/# and detector pixel pitch at a single wavelength.
+The MTF figures of merit use the composite of the diffraction-limited optics, the pixel aperture and Gaussian line-of-sight jitter; the blur spot is the diameter of the first dark ring of the Airy pattern and the ensquared energy is the fraction of the Airy pattern falling on a pixel centred on it.
+The dashed lines mark Q = Fλ/d of 0.5, 1 and 2.
+"""
@@ -0,0 +1,405 @@
+import functools
+
+import numpy as np
+import scipy.interpolate
+import scipy.special
+
+
+# Radius of the first dark ring of the Airy pattern, in units of λ·f/#
+AIRY_FIRST_ZERO = scipy.special.jn_zeros(1, 1)[0]/np.pi
+
+
+def optics_mtf(fnumber, xlambda, freq):
+    # Diffraction-limited MTF of an unobscured circular aperture for f/#,
+    # wavelength (µm) and spatial frequency (cy/µm), broadcast against each
+    # other; zero beyond the cutoff 1/(λ·f/#).
+    xx = np.clip(np.abs(freq)*np.asarray(xlambda)*np.asarray(fnumber), 0, 1)
+
+    return 2/np.pi*(np.arccos(xx) - xx*np.sqrt(1 - xx**2))
+
+
+def pixel_mtf(pitch, freq):
+    # MTF of a square pixel aperture of the given pitch (µm), 100% fill factor
+    return np.abs(np.sinc(np.asarray(freq)*np.asarray(pitch)))
+
+
+def system_mtf(fnumber, xlambda, pitch, freq):
+    # Optics, pixel and composite MTF in one broadcast evaluation; each term
+    # has the broadcast shape of its own arguments only.
+    optics = optics_mtf(fnumber, xlambda, freq)
+    pixel = pixel_mtf(pitch, freq)
+
+    return (optics, pixel, optics*pixel)
+
+
+# Registry of MTF terms: name -> (function, parameter names). Each function
+# takes the spatial frequency (cy/µm) and its parameters as keyword arguments,
+# all broadcast against each other. 'diffraction' and 'aberrated' are
+# alternative optics terms; the latter includes diffraction.
+MTF_TERMS = {}
+
+
+def mtf_term(name, *parameters):
+    def register(function):
+        MTF_TERMS[name] = (function, parameters)
+
+        return function
+
+    return register
+
+
+@mtf_term('diffraction', 'fnumber', 'xlambda')
+def _diffraction_term(freq, fnumber, xlambda):
+    return optics_mtf(fnumber, xlambda, freq)
+
+
+@mtf_term('pixel', 'pitch')
+def _pixel_term(freq, pitch):
+    return pixel_mtf(pitch, freq)
+
+
+@mtf_term('jitter', 'jitter')
+def jitter_mtf(freq, jitter):
+    # Gaussian random line-of-sight jitter, rms in µm on the focal plane
+    return np.exp(-2*(np.pi*np.asarray(jitter)*freq)**2)
+
+
+@mtf_term('smear', 'smear')
+def smear_mtf(freq, smear):
+    # Uniform linear motion of the given length (µm) during the integration time
+    return np.abs(np.sinc(np.asarray(freq)*np.asarray(smear)))
+
+
+@mtf_term('diffusion', 'diffusion_length')
+def diffusion_mtf(freq, diffusion_length):
+    # Lateral carrier diffusion with an exponential (e^{-|x|/L}) line spread, L in µm
+    return 1/(1 + (2*np.pi*np.asarray(diffusion_length)*freq)**2)
+
+
+@mtf_term('crosstalk', 'crosstalk', 'pitch')
+def crosstalk_mtf(freq, crosstalk, pitch):
+    # Fraction `crosstalk` of the signal leaking into each nearest neighbour
+    return 1 - 2*np.asarray(crosstalk)*(1 - np.cos(2*np.pi*np.asarray(freq)*np.asarray(pitch)))
+
+
+# The aberrated MTF is the autocorrelation of the pupil function, sampled with
+# _PUPIL_SAMPLES points across the diameter in an array twice as wide, so
+# that a shift of s samples is the normalized frequency ν = f·λ·f/# = s/N.
+# It is cut along x, for a field point on the x axis, and cached by its
+# Seidel coefficients in waves, so that changing f/# or wavelength alone
+# only rescales ν.
+_PUPIL_SAMPLES = 128
+_PUPIL_XX = (np.arange(2*_PUPIL_SAMPLES) - _PUPIL_SAMPLES + 0.5)*2/_PUPIL_SAMPLES
+_PUPIL_CACHE = {}
+
+
+def _wavefront(xx, yy, W020, W040, W131, W222):
+    # Seidel wavefront error (waves) at normalized pupil coordinates, field along x
+    rho2 = xx**2 + yy**2
+
+    return W020*rho2 + W040*rho2**2 + W131*rho2*xx + W222*xx**2
+
+
+def _pupil_mtf(waves, chunk_size=32):
+    # MTF cuts at ν = 0, 1/N, ..., 1 for rows of (W020, W040, W131, W222) in
+    # waves; rows not in the cache are computed in batches of FFTs
+    keys = [tuple(row) for row in waves.tolist()]
+    missing = sorted(set(keys) - _PUPIL_CACHE.keys())
+    if len(_PUPIL_CACHE) + len(missing) > 4096:
+        _PUPIL_CACHE.clear()
+
+    # only the middle half of the rows crosses the pupil
+    (xx, yy) = np.meshgrid(_PUPIL_XX, _PUPIL_XX[_PUPIL_SAMPLES//2:-_PUPIL_SAMPLES//2])
+    rho2 = xx**2 + yy**2
+    for lo in range(0, len(missing), chunk_size):
+        wavefront = _wavefront(xx, yy, *np.array(missing[lo:lo+chunk_size]).T[..., None, None])
+        pupil = np.where(rho2 <= 1, np.exp(2j*np.pi*wavefront), 0)
+
+        # autocorrelation along x, summed over y
+        otf = np.sum(np.fft.ifft(np.abs(np.fft.fft(pupil, axis=-1))**2, axis=-1), axis=-2)
+        mtf = np.abs(otf[:, :_PUPIL_SAMPLES+1])/np.abs(otf[:, :1])
+        mtf[:, -1] = 0
+        _PUPIL_CACHE.update(zip(missing[lo:lo+chunk_size], mtf))
+
+    return np.array([_PUPIL_CACHE[key] for key in keys])
+
+
+@mtf_term('aberrated', 'fnumber', 'xlambda', 'defocus', 'spherical', 'coma', 'astigmatism')
+def aberrated_mtf(freq, fnumber, xlambda, defocus=0.0, spherical=0.0, coma=0.0, astigmatism=0.0):
+    # Optics MTF including the Seidel aberrations W020 (defocus), W040
+    # (spherical), W131 (coma) and W222 (astigmatism), given as peak
+    # wavefront errors in µm at the edge of the pupil
+    (xlambda, *opd) = np.broadcast_arrays(xlambda, defocus, spherical, coma, astigmatism)
+    waves = np.round(np.stack(opd, axis=-1)/xlambda[..., None], 6)
+    (unique, inverse) = np.unique(waves.reshape((-1, 4)), axis=0, return_inverse=True)
+    cuts = _pupil_mtf(unique)
+
+    nu = np.clip(np.abs(freq)*xlambda*fnumber, 0, 1)*_PUPIL_SAMPLES
+    idx = np.minimum(nu.astype(int), _PUPIL_SAMPLES-1)
+    frac = nu - idx
+    inverse = inverse.reshape(xlambda.shape)
+
+    return cuts[inverse, idx]*(1 - frac) + cuts[inverse, idx+1]*frac
+
+
+def mtf_terms(freq, terms, **parameters):
+    # Every named term of MTF_TERMS at freq, each given the parameters it
+    # declares (missing ones take the term's defaults); returns a dict
+    return {
+        name: MTF_TERMS[name][0](freq, **{key: parameters[key] for key in MTF_TERMS[name][1] if key in parameters})
+        for name in terms
+    }
+
+
+def composite_mtf(freq, terms, **parameters):
+    # Product of the named terms, for as many configurations as the
+    # parameters broadcast to
+    return functools.reduce(np.multiply, mtf_terms(freq, terms, **parameters).values(), 1.0)
+
+
+def airy_psf(x):
+    # Airy pattern normalized to 1 at its centre, (2·J1(x)/x)² with
+    # x = π·r/(λ·f/#); vectorized, including x = 0
+    x = np.asarray(x, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(x == 0, 1.0, (2*scipy.special.j1(x)/x)**2)
+
+
+def blur_spot_diameter(fnumber, xlambda):
+    # Diameter (µm) of the first dark ring of the Airy pattern, 2.44·λ·f/#
+    return 2*AIRY_FIRST_ZERO*np.asarray(xlambda)*np.asarray(fnumber)
+
+
+def encircled_energy(fnumber, xlambda, radius):
+    # Fraction of the Airy PSF energy within `radius` (µm) of its centre,
+    # Rayleigh's closed form 1 - J0²(x) - J1²(x) with x = π·r/(λ·f/#);
+    # broadcast over all arguments
+    xx = np.pi*np.asarray(radius)/(np.asarray(xlambda)*np.asarray(fnumber))
+
+    return 1 - scipy.special.j0(xx)**2 - scipy.special.j1(xx)**2
+
+
+# Encircled energy against x = π·r/(λ·f/#), tabulated every 0.005 up to
+# x = 100 (99.4%) for inverse lookups; it is non-decreasing (its derivative is
+# 2·J1²(x)/x), which the running maximum enforces against round-off.
+_EE_X = np.linspace(0, 100, 20001)
+_EE_TABLE = np.maximum.accumulate(encircled_energy(1, 1, _EE_X/np.pi))
+
+
+def encircled_energy_radius(fnumber, xlambda, fraction):
+    # Radius (µm) enclosing the given fraction of the Airy PSF energy, by
+    # searchsorted in the table above and linear interpolation, refined by a
+    # Newton step on the closed form; broadcast, and NaN for fractions beyond
+    # the table.
+    fraction = np.asarray(fraction, dtype=float)
+    idx = np.clip(np.searchsorted(_EE_TABLE, fraction), 1, len(_EE_TABLE)-1)
+    (lo, hi) = (_EE_TABLE[idx-1], _EE_TABLE[idx])
+    xx = _EE_X[idx-1] + (fraction - lo)/(hi - lo)*(_EE_X[idx] - _EE_X[idx-1])
+
+    # the energy grows like x²/4 in the first interval, where the chord is a
+    # poor start; no step where the derivative vanishes (the dark rings)
+    xx = np.where(idx > 1, xx, 2*np.sqrt(np.maximum(fraction, 0)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = 2*scipy.special.j1(xx)**2/xx
+        xx = np.where(slope > 1e-9, xx - (encircled_energy(1, 1, xx/np.pi) - fraction)/slope, xx)
+
+    return np.where(fraction <= _EE_TABLE[-1], xx/np.pi*np.asarray(xlambda)*np.asarray(fnumber), np.nan)
+
+
+@functools.cache
+def _ensquared_energy_table():
+    # Ensquared energy of the Airy PSF on a centred square of side a·λ·f/#,
+    # a²∫∫ MTF(ν)·sinc(a·νx)·sinc(a·νy) dν over the normalized frequency plane,
+    # with Gauss–Legendre quadrature in polar coordinates (eightfold symmetry),
+    # tabulated every 0.1 up to a = 40 and splined; ~2e-5 absolute error.
+    aa = np.linspace(0, 40, 401)
+    (nu, w_nu) = np.polynomial.legendre.leggauss(128)
+    (theta, w_theta) = np.polynomial.legendre.leggauss(32)
+    (nu, w_nu) = ((nu + 1)/2, w_nu/2)
+    (theta, w_theta) = ((theta + 1)*np.pi/8, w_theta*np.pi/8)
+
+    anu = aa[:, None, None]*nu[:, None]
+    angular = 8*np.sum(np.sinc(anu*np.cos(theta))*np.sinc(anu*np.sin(theta))*w_theta, axis=-1)
+    energy = aa**2*np.sum(optics_mtf(1, 1, nu)*nu*w_nu*angular, axis=-1)
+
+    return scipy.interpolate.CubicSpline(aa, energy)
+
+
+def ensquared_energy(fnumber, xlambda, pitch):
+    # Fraction of the diffraction-limited (Airy) PSF falling on a square pixel
+    # of side pitch (µm) centred on it; beyond the table the energy outside
+    # the pixel falls off like 1/pitch.
+    table = _ensquared_energy_table()
+    aa = np.asarray(pitch)/(np.asarray(xlambda)*np.asarray(fnumber))
+    edge = table.x[-1]
+
+    with np.errstate(divide='ignore'):
+        return np.where(aa <= edge, table(np.minimum(aa, edge)), 1 - (1 - table(edge))*edge/aa)
+
+
+def figures_of_merit(fnumber, xlambda, pitch, terms=('diffraction', 'pixel'), *, chunk_size=16384, **parameters):
+    # System figures of merit for every configuration that f/#, wavelength
+    # (µm), pitch (µm) and the parameters of the MTF terms broadcast to, worked
+    # out chunk_size configurations at a time so memory stays bounded:
+    #   Q: λ·f/#/pitch
+    #   blur_spot: diameter of the first dark ring of the Airy PSF over the pitch
+    #   mtf_nyquist: composite MTF of `terms` at the Nyquist frequency 1/(2·pitch)
+    #   mtf50: lowest frequency (cy/µm) where the composite MTF falls to 0.5,
+    #       bracketed on 33 samples up to the optics cutoff and bisected
+    #   ensquared_energy: see ensquared_energy(), diffraction only
+    arrays = np.broadcast_arrays(fnumber, xlambda, pitch, *parameters.values())
+    shape = arrays[0].shape
+    (fnumber, xlambda, pitch, *values) = (np.ravel(np.asarray(xx, dtype=float)) for xx in arrays)
+
+    Q = xlambda*fnumber/pitch
+    results = {
+        'Q': Q,
+        'blur_spot': blur_spot_diameter(fnumber, xlambda)/pitch,
+        'mtf_nyquist': np.empty(Q.shape),
+        'mtf50': np.empty(Q.shape),
+        'ensquared_energy': np.empty(Q.shape),
+    }
+
+    for lo in range(0, len(Q), chunk_size):
+        chunk = slice(lo, lo+chunk_size)
+        config = dict(zip(parameters, (xx[chunk, None] for xx in values)))
+        config.update(fnumber=fnumber[chunk, None], xlambda=xlambda[chunk, None], pitch=pitch[chunk, None])
+
+        results['ensquared_energy'][chunk] = ensquared_energy(fnumber[chunk], xlambda[chunk], pitch[chunk])
+        results['mtf_nyquist'][chunk] = composite_mtf(1/(2*config['pitch']), terms, **config)[:, 0]
+
+        freq = np.linspace(0, 1, 33)/(config['xlambda']*config['fnumber'])
+        below = composite_mtf(freq, terms, **config) < 0.5
+        first = np.argmax(below, axis=-1)[:, None]
+        (f_lo, f_hi) = (np.take_along_axis(freq, np.maximum(first-1, 0), axis=-1), np.take_along_axis(freq, first, axis=-1))
+        for _ in range(20):
+            f_mid = (f_lo + f_hi)/2
+            above = composite_mtf(f_mid, terms, **config) >= 0.5
+            (f_lo, f_hi) = (np.where(above, f_mid, f_lo), np.where(above, f_hi, f_mid))
+        results['mtf50'][chunk] = np.where(np.any(below, axis=-1), (f_lo + f_hi)[:, 0]/2, np.nan)
+
+    return {key: xx.reshape(shape) for (key, xx) in results.items()}
+
+
+# Polychromatic PSFs are split into sub-bands spanning at most a factor
+# _PSF_BAND in wavelength, each sampled at min(λ)·f/#/2, the Nyquist interval
+# of its shortest wavelength, on a _PSF_SAMPLES² grid. The pupil of each
+# wavelength is drawn N·spacing/(λ·f/#) samples across, between N/4 and N/2,
+# so that the wavelengths of a sub-band land on the same grid and go through
+# one batched FFT, and the grid spans at least 64·λ·f/# of each, so that the
+# periodic copies of the PSF the FFT adds up are negligible.
+_PSF_SAMPLES = 256
+_PSF_BAND = 2.0
+
+
+@functools.lru_cache(maxsize=32)
+def _polychromatic_psf(fnumber, xlambda, weights, aberrations, chunk_size=8):
+    order = np.argsort(xlambda)
+    xlambda = np.array(xlambda)[order]
+    weights = (np.array(weights)/np.sum(weights))[order]
+    coords = np.arange(_PSF_SAMPLES) - _PSF_SAMPLES//2
+
+    components = []
+    band_lo = 0
+    while band_lo < len(xlambda):
+        band_hi = np.searchsorted(xlambda, _PSF_BAND*xlambda[band_lo], side='right')
+        spacing = xlambda[band_lo]*fnumber/2
+
+        psf = np.zeros((_PSF_SAMPLES, _PSF_SAMPLES))
+        for lo in range(band_lo, band_hi, chunk_size):
+            hi = min(lo + chunk_size, band_hi)
+            radius = (_PSF_SAMPLES*spacing/(xlambda[lo:hi]*fnumber)/2)[:, None, None]
+            (xx, yy) = (coords/radius, coords[:, None]/radius)
+            waves = np.array(aberrations)[:, None, None, None]/xlambda[lo:hi, None, None]
+            pupil = np.where(xx**2 + yy**2 <= 1, np.exp(2j*np.pi*_wavefront(xx, yy, *waves)), 0)
+
+            intensity = np.abs(np.fft.fft2(np.fft.ifftshift(pupil, axes=(-2, -1))))**2
+            psf += np.tensordot(weights[lo:hi], intensity/np.sum(intensity, axis=(-2, -1), keepdims=True), axes=1)
+
+        psf = np.fft.fftshift(psf)
+        psf.flags.writeable = False
+        components.append((spacing, psf))
+        band_lo = band_hi
+
+    return tuple(components)
+
+
+def _psf_arguments(fnumber, xlambda, weights, defocus, spherical, coma, astigmatism):
+    xlambda = np.atleast_1d(np.asarray(xlambda, dtype=float))
+    weights = np.ones(xlambda.shape) if weights is None else np.broadcast_to(np.asarray(weights, dtype=float), xlambda.shape)
+
+    return (float(fnumber), tuple(xlambda.tolist()), tuple(weights.tolist()), tuple(map(float, (defocus, spherical, coma, astigmatism))))
+
+
+def polychromatic_psf(fnumber, xlambda, weights=None, *, defocus=0.0, spherical=0.0, coma=0.0, astigmatism=0.0):
+    # PSF of the optics, with aberrations as in aberrated_mtf(), averaged over
+    # the wavelengths (µm) with the given spectral weights (equal by default).
+    # Returns one (spacing, psf) pair per sub-band (see above), from the
+    # shortest wavelengths: the grid spacing in µm and a read-only square
+    # array centred on the chief ray, holding the sub-band's share of the
+    # weights, so that the arrays sum to 1 together; cached.
+    return _polychromatic_psf(*_psf_arguments(fnumber, xlambda, weights, defocus, spherical, coma, astigmatism))
+
+
+def _pixel_weights(centres, pitch, spacing):
+    # W (Npixels × _PSF_SAMPLES): integral over each pixel of side pitch (µm)
+    # centred at `centres` of the sinc interpolant of each PSF sample, in
+    # closed form (Si(π·(d + p/2)/s) - Si(π·(d - p/2)/s))/π
+    coords = spacing*(np.arange(_PSF_SAMPLES) - _PSF_SAMPLES//2)
+    dd = (np.asarray(centres)[:, None] - coords)/spacing
+    (hi, _) = scipy.special.sici(np.pi*(dd + pitch/spacing/2))
+    (lo, _) = scipy.special.sici(np.pi*(dd - pitch/spacing/2))
+
+    return (hi - lo)/np.pi
+
+
+def pixel_energy(fnumber, xlambda, pitch, weights=None, *, neighbours=1, offset=(0.0, 0.0), defocus=0.0, spherical=0.0, coma=0.0, astigmatism=0.0):
+    # Fraction of the polychromatic PSF energy collected by each pixel of the
+    # (2·neighbours+1)² block of square pixels of side pitch (µm) around the
+    # one centred at `offset` (x, y in µm) from the chief ray; rows are y.
+    # The PSF is Nyquist-sampled, so its sinc interpolant is integrated over
+    # each pixel exactly, one axis at a time. Unlike a DFT at the pixel
+    # centres, this does not treat the PSF grid as periodic, so blocks wider
+    # than the grid do not count its periodic copies. Sub-bands sampled on
+    # different grids (see polychromatic_psf) are integrated separately.
+    centres = pitch*np.arange(-neighbours, neighbours+1)
+
+    energy = 0
+    for (spacing, psf) in _polychromatic_psf(*_psf_arguments(fnumber, xlambda, weights, defocus, spherical, coma, astigmatism)):
+        (wx, wy) = (_pixel_weights(centres + shift, pitch, spacing) for shift in offset)
+        energy = energy + wy @ psf @ wx.T
+
+    # the interpolant rings where the grid truncates the tails of the PSF,
+    # which can take a block holding all of the energy ~1e-6 above it
+    return energy/max(1.0, np.sum(energy))
+
+
+def _cache_key(xx):
+    xx = np.asarray(xx, dtype=float)
+
+    return (xx.shape, xx.tobytes())
+
+
+def _from_cache_key(key):
+    (shape, data) = key
+
+    return np.frombuffer(data).reshape(shape)
+
+
+@functools.lru_cache(maxsize=128)
+def _cached_mtf_terms(freq, terms, parameters):
+    terms = mtf_terms(_from_cache_key(freq), terms, **{key: _from_cache_key(xx) for (key, xx) in parameters})
+    for term in terms.values():
+        term.flags.writeable = False
+
+    return terms
+
+
+def cached_mtf_terms(freq, terms, **parameters):
+    # mtf_terms() memoized on the values of its arguments; the arrays returned
+    # are shared between calls and read-only.
+    return _cached_mtf_terms(
+        _cache_key(freq), tuple(terms),
+        tuple(sorted((key, _cache_key(xx)) for (key, xx) in parameters.items())),
+    )
@@ -9,114 +9,122 @@
 
 # %%
 # %matplotlib widget
-import base64
-import io
-import pathlib
-
 import ipyvuetify as v
 import ipywidgets as widgets
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
 
+from atmosphere import (
+    EXPORT_FORMATS,
+    HAZE_NAMES,
+    MODEL_NAMES,
+    TransmissionTable,
+    band_average,
+    cumulative_integral,
+    export,
+)
 from controls import (
+    ComputeScheduler,
+    FileDownload,
+    IncrementalFigure,
     MyFloatRangeSlider,
+    MyFloatSlider,
+    Parameters,
     SpectralBandsControlPanel,
+    Throttle,
+    profiling_panel,
 )
 
 
-parameters = {
+transmission = TransmissionTable.load()
+xlambda = transmission.xlambda
+
+
+parameters = Parameters({
     'model': 6,
-    'range': 1,
-    'haze': 1,
+    'range': 0.5,
+    'haze': 0,
+    'altitude': transmission.altitudes[0],
+    'resolution': 0.0,
     'spectral_bands': [(3.0, 5.0), (8.0, 12.0)],
     'figure_xlim': [0.2, 25],
-}
+}, scheduler=ComputeScheduler())
 
 
-data = np.load(pathlib.Path().resolve() / 'lowtran7.npz')
-xlambda = data['xlambda'][::-1]
-Tcoeff = data['Tcoeff'][:, ::-1]
+output = widgets.Output()
 
 
-output = widgets.Output()
+@parameters.derived(names=['resolution'])
+def current_table(resolution):
+    if resolution:
+        return transmission.resample('triangular', resolution)
 
+    return transmission
 
-class Figure():
-    def __init__(self):
-        (fig, ax) = plt.subplots(constrained_layout=True)
 
-        fig.canvas.header_visible = False
-        fig.canvas.toolbar_visible = True
-        fig.canvas.toolbar_position = 'right'
+@parameters.derived(names=['current_table', 'model', 'range', 'haze', 'altitude'])
+def spectrum(current_table, model, range, haze, altitude):
+    return current_table.spectrum(model, range, haze, altitude)
 
-        self.fig = fig
-        self.ax = ax
 
-        self.update()
+# computed once per spectrum, so that moving the bands only costs the lookups
+@parameters.derived(names=['spectrum'])
+def cumulative(spectrum):
+    return cumulative_integral(xlambda, spectrum)
 
-    @property
-    def canvas(self):
-        return self.fig.canvas
 
-    def update(self):
-        self.plot()
+@parameters.derived(names=['spectrum', 'cumulative', 'spectral_bands'])
+def band_averages(spectrum, cumulative, spectral_bands):
+    return band_average(xlambda, spectrum, cumulative, spectral_bands)
+
 
+class Figure(IncrementalFigure):
+    def __init__(self):
+        (fig, ax) = plt.subplots(constrained_layout=True)
+
+        self.ax = ax
         self.ax.set_xlabel('Wavelength (µm)')
         self.ax.set_ylabel('Transmission')
+        self.ax.grid(True)
+
+        super().__init__(fig)
+
+    def update(self):
+        self.plot()
 
         self.ax.set_xlim(parameters['figure_xlim'])
         self.ax.set_ylim([0, 1])
 
-        self.ax.grid(True)
+        self.draw()
+
+    def update_xlim(self):
+        self.ax.set_xlim(parameters['figure_xlim'])
 
-        self.fig.canvas.draw_idle()
+        self.draw()
 
     def plot(self):
-        model_idx = parameters['model'] - 1
-        range_idx = parameters['range'] - 1
-        haze_idx = parameters['haze'] - 1
-        data_idx = np.ravel_multi_index((model_idx, range_idx, haze_idx), (6, 7, 4))
+        Tcoeff = parameters['spectrum']
 
-        self.ax.clear()
-        self.ax.plot(xlambda, Tcoeff[data_idx])
+        self.line(self.ax, 'spectrum', xlambda, Tcoeff)
 
         for (idx, (lambda_min, lambda_max)) in enumerate(parameters['spectral_bands']):
-            self.ax.fill_between(
+            self.fill_between(
+                self.ax, ('band', idx),
                 xlambda[np.logical_and(xlambda > lambda_min, xlambda < lambda_max)],
-                Tcoeff[data_idx][np.logical_and(xlambda > lambda_min, xlambda < lambda_max)],
+                Tcoeff[np.logical_and(xlambda > lambda_min, xlambda < lambda_max)],
                 label=f'Band #{idx+1}',
                 color='none',
                 hatch='///',
                 edgecolor=f'C{idx}',
                 alpha=0.5
                 )
-        self.ax.legend()
+        self.legend(self.ax)
 
 
 class Table():
     def __init__(self):
-        self.widget = v.Html(tag='div', class_='d-flex flex-row', children=[])
-
-        self.update()
-
-    def update(self):
-        model_idx = parameters['model'] - 1
-        range_idx = parameters['range'] - 1
-        haze_idx = parameters['haze'] - 1
-        data_idx = np.ravel_multi_index((model_idx, range_idx, haze_idx), (6, 7, 4))
-
-        spectral_bands = parameters['spectral_bands']
-
-        values = [
-            np.trapezoid(
-                Tcoeff[data_idx][np.logical_and(xlambda > lambda_min, xlambda < lambda_max)],
-                xlambda[np.logical_and(xlambda > lambda_min, xlambda < lambda_max)]
-                ) / (lambda_max-lambda_min)
-            for (lambda_min, lambda_max) in spectral_bands
-            ]
-
-        table = v.DataTable(
+        self.table = v.DataTable(
             style_='width: 100%',
             hide_default_footer=True,
             disable_sort=True,
@@ -124,42 +132,68 @@ class Table():
                 {'text': 'Parameter', 'value': 'parameter'},
                 {'text': 'Value', 'value': 'value'},
             ],
-            items=[
-                {
-                    'parameter': f'Band #{idx+1} average transmission',
-                    'value': f'{value:.3f}',
-                }
-                for (idx, value) in enumerate(values)
-            ],
+            items=[],
         )
-        self.widget.children = [table]
+        self.widget = v.Html(tag='div', class_='d-flex flex-row', children=[self.table])
+
+        self.update()
+
+    def update(self):
+        values = parameters['band_averages']
+
+        self.table.items = [
+            {
+                'parameter': f'Band #{idx+1} average transmission',
+                'value': f'{value:.3f}',
+            }
+            for (idx, value) in enumerate(values)
+        ]
 
 
 class Downloader():
     def __init__(self):
-        self.widget0 = v.Btn(text=True, children=['Prepare Data Export'])
-        self.widget0.on_event('click', self.prepare_download)
-        self.widget = widgets.HBox([self.widget0])
+        self.cases = v.Select(
+            label='Cases',
+            items=[
+                {'text': 'Current spectrum', 'value': 'current'},
+                {'text': 'All ranges', 'value': 'ranges'},
+                {'text': 'All cases', 'value': 'all'},
+            ],
+            v_model='current',
+            dense=True,
+            )
+        self.format = v.Select(
+            label='Format',
+            items=[{'text': xx.upper(), 'value': xx} for xx in EXPORT_FORMATS],
+            v_model='csv',
+            dense=True,
+            )
+        self.button = v.Btn(text=True, children=[v.Icon(left=True, children=['mdi-download']), 'Export'])
+        self.button.on_event('click', self.download)
+        self.file_download = FileDownload()
 
-        self.reset()
+        self.widget = widgets.HBox([self.cases, self.format, self.button, self.file_download])
 
-    def prepare_download(self, widget, event, data):
-        model_idx = parameters['model'] - 1
-        range_idx = parameters['range'] - 1
-        haze_idx = parameters['haze'] - 1
-        data_idx = np.ravel_multi_index((model_idx, range_idx, haze_idx), (6, 7, 4))
+    def select(self):
+        if self.cases.v_model == 'current':
+            cases = {key: np.array([parameters[key]]) for key in ('model', 'range', 'haze', 'altitude')}
 
-        with io.StringIO() as data_table:
-            print('Wavelength (um),Transmission', end='\r\n', file=data_table)
-            np.savetxt(data_table, np.column_stack((xlambda, Tcoeff[data_idx])), fmt=['%.4f', '%.6f'], delimiter=',', newline='\r\n')
-            payload = base64.b64encode(data_table.getvalue().encode()).decode()
+            return (parameters['spectrum'][None], cases)
 
-        self.widget.children = [
-            v.Btn(txt=True, children=[v.Icon(children=['mdi-download'])], href=f'data:text/csv;base64,{payload}', attributes={'download': 'lowtran7.csv'})
-        ]
+        table = parameters['current_table']
+        if self.cases.v_model == 'ranges':
+            idx = table.case_index(parameters['model'], table.ranges, parameters['haze'], parameters['altitude'])
+        else:
+            idx = np.arange(len(table.Tcoeff))
+
+        return (table.Tcoeff[idx], {key: xx[idx] for (key, xx) in table.cases.items()})
 
-    def reset(self):
-        self.widget.children = [self.widget0]
+    @output.capture()
+    def download(self, widget, event, data):
+        (Tcoeff, cases) = self.select()
+        (extension, mime) = EXPORT_FORMATS[self.format.v_model]
+
+        self.file_download.send_file(f'lowtran7.{extension}', mime, export(self.format.v_model, xlambda, Tcoeff, cases))
 
 
 plt.ioff()
@@ -171,42 +205,36 @@ downloader = Downloader()
 
 model = v.Select(
     label='Model',
-    items=[
-        {'text': 'Tropical', 'value': 1},
-        {'text': 'Midlatitude Summer', 'value': 2},
-        {'text': 'Midlatitude Winter', 'value': 3},
-        {'text': 'Subarctic Summer', 'value': 4},
-        {'text': 'Subarctic Winter', 'value': 5},
-        {'text': '1976 US Standard', 'value': 6},
-        ],
+    items=[{'text': MODEL_NAMES[int(xx)], 'value': int(xx)} for xx in transmission.models],
     value=parameters['model'],
     )
 
-range = v.Select(
+range = MyFloatSlider(
     label='Range (km)',
-    items=[
-        {'text': 0.5, 'value': 1},
-        {'text': 1, 'value': 2},
-        {'text': 2, 'value': 3},
-        {'text': 5, 'value': 4},
-        {'text': 10, 'value': 5},
-        {'text': 20, 'value': 6},
-        {'text': 50, 'value': 7},
-        ],
     value=parameters['range'],
+    min=transmission.ranges[0],
+    max=transmission.ranges[-1],
+    step=0.1,
     )
 
 haze = v.Select(
     label='Haze',
-    items=[
-        {'text': 'None', 'value': 1},
-        {'text': 'Rural (23 km)', 'value': 2},
-        {'text': 'Rural (5 km)', 'value': 3},
-        {'text': 'Urban (5 km)', 'value': 4},
-        ],
+    items=[{'text': HAZE_NAMES[int(xx)], 'value': int(xx)} for xx in transmission.haze_types],
     value=parameters['haze'],
     )
 
+altitude = v.Select(
+    label='Altitude (km)',
+    items=[{'text': f'{xx:g}', 'value': float(xx)} for xx in transmission.altitudes],
+    value=parameters['altitude'],
+    )
+
+resolution = v.Select(
+    label='Resolution (cm⁻¹)',
+    items=[{'text': 'LOWTRAN7', 'value': 0.0}] + [{'text': f'{xx:g} (triangular)', 'value': xx} for xx in [20.0, 50.0, 100.0, 200.0]],
+    value=parameters['resolution'],
+    )
+
 spectral_bands_control_panel = SpectralBandsControlPanel(
     spectral_bands=parameters['spectral_bands'],
     lambda_min=np.min(xlambda),
@@ -223,41 +251,56 @@ figure_xlim = MyFloatRangeSlider(
 )
 
 
-def update():
-    figure.update()
-    table.update()
-    downloader.reset()
+parameters.observe(figure.update, names=['spectrum', 'spectral_bands'])
+parameters.observe(figure.update_xlim, names=['figure_xlim'])
+parameters.observe(table.update, names=['band_averages'])
+
 
+# coalesces events while a control is dragged, at most one redraw per 100 ms
+throttle = Throttle(interval=0.1)
 
+
+@throttle
 @output.capture()
 def update_model(widget, event, data):
     parameters.update({'model': data})
-    update()
 
 
-def update_range(widget, event, data):
-    parameters.update({'range': data})
-    update()
+@throttle
+def update_range(change):
+    parameters.update({'range': change.new})
 
 
+@throttle
 def update_haze(widget, event, data):
     parameters.update({'haze': data})
-    update()
 
 
+@throttle
+def update_altitude(widget, event, data):
+    parameters.update({'altitude': data})
+
+
+@throttle
+def update_resolution(widget, event, data):
+    parameters.update({'resolution': data})
+
+
+@throttle
 def update_wavelengths():
-    parameters['spectral_bands'] = spectral_bands_control_panel.spectral_bands
-    update()
+    parameters.update({'spectral_bands': spectral_bands_control_panel.spectral_bands})
 
 
+@throttle
 def update_xlim(change):
     parameters.update({'figure_xlim': change.new})
-    figure.update()
 
 
 model.on_event('change', update_model)
-range.on_event('change', update_range)
+range.observe(update_range, names='value')
 haze.on_event('change', update_haze)
+altitude.on_event('change', update_altitude)
+resolution.on_event('change', update_resolution)
 spectral_bands_control_panel.on_change(update_wavelengths)
 figure_xlim.observe(update_xlim, names='value')
 
@@ -275,6 +318,8 @@ v.Container(fluid=True, children=[
                         model,
                         range,
                         haze,
+                        altitude,
+                        resolution,
                     ]),
             ]),
             v.Card(
@@ -317,6 +362,7 @@ v.Container(fluid=True, children=[
     #         output
     #     ]),
     # ]),
+    *profiling_panel(),
 ])
 
 
@@ -325,4 +371,9 @@ v.Container(fluid=True, children=[
 ## Description
 
 This notebook computes transmission through atmosphere for different atmospheric models at a variety of ranges.
+Between the ranges tabulated with LOWTRAN7 the optical depth is interpolated per wavenumber as a power law in range.
+The spectrum can be smoothed to a coarser instrument resolution by convolving it in wavenumber with a triangular slit function of the given full width at half maximum.
+
+The export saves the current spectrum, all tabulated ranges of the current model and haze, or every case of the table (at the selected resolution), with one transmission column per case.
+CSV and Parquet files have a wavelength column, NPZ files hold `xlambda`, `Tcoeff` and the model, range, haze and altitude of each case, and FLOAT32 files are a raw little-endian (cases + 1) × wavelengths array whose first row is the wavelength.
 """
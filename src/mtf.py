@@ -9,6 +9,8 @@
 
 # %%
 # %matplotlib widget
+import functools
+
 import ipyvuetify as v
 import ipywidgets as widgets
 import matplotlib as mpl
@@ -16,33 +18,65 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 from controls import (
+    ComputeScheduler,
+    IncrementalFigure,
     MyFloatSlider,
+    Parameters,
+    Throttle,
     WavelengthsControlPanel,
+    profiling_panel,
+)
+from imaging import (
+    cached_mtf_terms,
 )
 
 
-parameters = {
+parameters = Parameters({
     'fnumber': 2,
     'pixel_pitch': 12,
     'wavelengths': [3, 5],
-}
-
-
-def optics_mtf(fnumber, xlambda, freq):
-    freq_cutoff = 1/xlambda/fnumber
-    xx = freq/freq_cutoff
-
-    return np.piecewise(xx, [xx <= 1, xx > 1], [lambda x: 2/np.pi*(np.arccos(x)-x*np.sqrt(1-x**2)), 0])
-
+    'defocus': 0.0,
+    'spherical': 0.0,
+    'jitter': 0.0,
+    'diffusion_length': 0.0,
+}, scheduler=ComputeScheduler())
+
+
+# spatial frequencies up to twice the Nyquist frequency (cycles/µm)
+@parameters.derived(names=['pixel_pitch'])
+def freq(pixel_pitch):
+    return 2/pixel_pitch*np.linspace(0, 1, 201)
+
+
+@parameters.derived(names=['freq', 'fnumber', 'wavelengths', 'defocus', 'spherical'])
+def optics_mtf(freq, fnumber, wavelengths, defocus, spherical):
+    term = 'aberrated' if defocus != 0 or spherical != 0 else 'diffraction'
+
+    return cached_mtf_terms(
+        freq, (term,),
+        fnumber=fnumber,
+        xlambda=np.array(wavelengths)[:, None],
+        defocus=defocus,
+        spherical=spherical,
+    )[term]
+
+
+@parameters.derived(names=['freq', 'pixel_pitch', 'diffusion_length', 'jitter'])
+def detector_mtf(freq, pixel_pitch, diffusion_length, jitter):
+    return cached_mtf_terms(
+        freq, ('pixel', 'diffusion', 'jitter'),
+        pitch=pixel_pitch,
+        diffusion_length=diffusion_length,
+        jitter=jitter,
+    )
 
-def pixel_mtf(pitch, freq):
-    xx = freq*pitch
-    mtf = np.abs(np.sinc(xx))
 
-    return mtf
+@parameters.derived(names=['optics_mtf', 'detector_mtf'])
+def composite_mtf(optics_mtf, detector_mtf):
+    return functools.reduce(np.multiply, detector_mtf.values(), optics_mtf)
 
 
-class Figure():
+class Figure(IncrementalFigure):
     def __init__(self):
         fig = plt.figure(constrained_layout=True)
         gridspec = mpl.gridspec.GridSpec(nrows=2, ncols=2, figure=fig)
@@ -50,20 +84,20 @@ class Figure():
         ax2 = fig.add_subplot(gridspec[0, 1])
         ax3 = fig.add_subplot(gridspec[1, :])
 
-        fig.canvas.header_visible = False
-        fig.canvas.toolbar_visible = True
-        fig.canvas.toolbar_position = 'right'
-
-        self.fig = fig
         self.ax1 = ax1
         self.ax2 = ax2
         self.ax3 = ax3
 
-        self.update()
+        self.ax1.set_title('Optics MTF')
+        self.ax2.set_title('Detector MTF')
+        self.ax3.set_title('Composite MTF')
+        for ax in self.axes:
+            ax.set_ylabel('MTF')
+            ax.set_xlabel('Spatial Frequency (lp/mm)')
+            ax.set_yticks(np.linspace(0, 1, 6))
+            ax.grid(True)
 
-    @property
-    def canvas(self):
-        return self.fig.canvas
+        super().__init__(fig)
 
     @property
     def axes(self):
@@ -71,65 +105,53 @@ class Figure():
 
     def update(self):
         self.plot_optics_mtf()
-        self.plot_pixel_mtf()
+        self.plot_detector_mtf()
         self.plot_composite_mtf()
 
-        for ax in self.axes:
-            ax.set_ylabel('MTF')
-            ax.set_xlabel('Spatial Frequency (lp/mm)')
-            ax.grid(True)
-
-        self.ax1.legend()
-        self.ax3.legend()
-
-        self.fig.canvas.draw_idle()
+        self.draw()
 
     def plot_optics_mtf(self):
-        fnumber = parameters['fnumber']
-        pixel_pitch = parameters['pixel_pitch']
-        xlambda = parameters['wavelengths']
-
-        self.ax1.clear()
-        self.ax1.set_title('Optics MTF')
-        for (idx, xx) in enumerate(xlambda):
-            freq = 2/pixel_pitch*np.linspace(0, 1, 101)
-            mtf = optics_mtf(fnumber, xx, freq)
-            self.ax1.plot(freq*1000, mtf, label=f'$\lambda_{idx}$')
-
-        self.ax1.set_yticks(np.linspace(0, 1, 6))
-
-    def plot_pixel_mtf(self):
-        pixel_pitch = parameters['pixel_pitch']
-
-        freq = 2/pixel_pitch*np.linspace(0, 1, 201)
-
-        mtf = pixel_mtf(pixel_pitch, freq)
-
-        self.ax2.clear()
-        self.ax2.set_title('Pixel MTF')
-        self.ax2.plot(freq*1000, mtf)
-
-        self.ax2.set_yticks(np.linspace(0, 1, 6))
+        freq = parameters['freq']
+        for (idx, xx) in enumerate(parameters['optics_mtf']):
+            self.line(self.ax1, ('optics', idx), freq*1000, xx, label=f'$\\lambda_{idx}$')
+
+        self.autoscale(self.ax1)
+        self.legend(self.ax1)
+
+    def plot_detector_mtf(self):
+        freq = parameters['freq']
+        mtf = parameters['detector_mtf']
+        self.line(self.ax2, 'pixel', freq*1000, mtf['pixel'], label='Pixel')
+        shown = 1
+        for (key, parameter, label) in (('diffusion', 'diffusion_length', 'Diffusion'), ('jitter', 'jitter', 'Jitter')):
+            if parameters[parameter] != 0:
+                self.line(self.ax2, key, freq*1000, mtf[key], label=label, color=f'C{shown}')
+                shown += 1
+            else:
+                self.remove(key)
+
+        self.autoscale(self.ax2)
+        self.legend(self.ax2)
 
     def plot_composite_mtf(self):
-        fnumber = parameters['fnumber']
-        pixel_pitch = parameters['pixel_pitch']
-        xlambda = parameters['wavelengths']
-
-        self.ax3.clear()
-        self.ax3.set_title('Composite MTF')
-        for (idx, xx) in enumerate(xlambda):
-            freq = 2/pixel_pitch*np.linspace(0, 1, 101)
-            mtf = optics_mtf(fnumber, xx, freq) * pixel_mtf(pixel_pitch, freq)
-            self.ax3.plot(freq*1000, mtf, label=f'$\lambda_{idx}$')
+        freq = parameters['freq']
+        for (idx, xx) in enumerate(parameters['composite_mtf']):
+            self.line(self.ax3, ('composite', idx), freq*1000, xx, label=f'$\\lambda_{idx}$')
 
-        self.ax3.set_yticks(np.linspace(0, 1, 6))
+        self.autoscale(self.ax3)
+        self.legend(self.ax3)
 
 
 plt.ioff()
 
 figure = Figure()
 
+# each axes is updated on its own, the canvas is drawn once after them
+parameters.observe(figure.plot_optics_mtf, names=['optics_mtf'])
+parameters.observe(figure.plot_detector_mtf, names=['detector_mtf'])
+parameters.observe(figure.plot_composite_mtf, names=['composite_mtf'])
+parameters.observe(figure.draw, names=['composite_mtf'])
+
 fnumber = MyFloatSlider(
     label='Optics f/#',
     value=parameters['fnumber'],
@@ -146,26 +168,86 @@ pixel_pitch = MyFloatSlider(
     step=1,
     )
 
+defocus = MyFloatSlider(
+    label='Defocus W020 (µm)',
+    value=parameters['defocus'],
+    min=0,
+    max=5,
+    step=0.1,
+    )
+
+spherical = MyFloatSlider(
+    label='Spherical W040 (µm)',
+    value=parameters['spherical'],
+    min=0,
+    max=5,
+    step=0.1,
+    )
+
+jitter = MyFloatSlider(
+    label='Jitter (µm rms)',
+    value=parameters['jitter'],
+    min=0,
+    max=20,
+    step=0.5,
+    )
+
+diffusion_length = MyFloatSlider(
+    label='Diffusion Length (µm)',
+    value=parameters['diffusion_length'],
+    min=0,
+    max=50,
+    step=1,
+    )
+
 wavelengths_control_panel = WavelengthsControlPanel(xlambda=parameters['wavelengths'])
 
 
+# coalesces events while a control is dragged, at most one redraw per 150 ms
+throttle = Throttle(interval=0.15)
+
+
+@throttle
 def update_fnumber(change):
     parameters.update({'fnumber': change.new})
-    figure.update()
 
 
+@throttle
 def update_pixel_pitch(change):
     parameters.update({'pixel_pitch': change.new})
-    figure.update()
 
 
+@throttle
+def update_defocus(change):
+    parameters.update({'defocus': change.new})
+
+
+@throttle
+def update_spherical(change):
+    parameters.update({'spherical': change.new})
+
+
+@throttle
+def update_jitter(change):
+    parameters.update({'jitter': change.new})
+
+
+@throttle
+def update_diffusion_length(change):
+    parameters.update({'diffusion_length': change.new})
+
+
+@throttle
 def update_wavelengths():
-    parameters['wavelengths'] = wavelengths_control_panel.xlambda
-    figure.update()
+    parameters.update({'wavelengths': wavelengths_control_panel.xlambda})
 
 
 fnumber.observe(update_fnumber, names='value')
 pixel_pitch.observe(update_pixel_pitch, names='value')
+defocus.observe(update_defocus, names='value')
+spherical.observe(update_spherical, names='value')
+jitter.observe(update_jitter, names='value')
+diffusion_length.observe(update_diffusion_length, names='value')
 wavelengths_control_panel.on_change(update_wavelengths)
 
 
@@ -182,6 +264,18 @@ v.Container(fluid=True, children=[
                         pixel_pitch,
                     ]),
             ]),
+            v.Card(
+                class_='mb-4',
+                outlined=True,
+                children=[
+                    v.CardTitle(children=['Aberrations and Blur']),
+                    v.CardText(children=[
+                        defocus,
+                        spherical,
+                        jitter,
+                        diffusion_length,
+                    ]),
+            ]),
             v.Card(
                 class_='mb-4',
                 outlined=True,
@@ -209,6 +303,7 @@ v.Container(fluid=True, children=[
     #         output
     #     ]),
     # ]),
+    *profiling_panel(),
 ])
 
 # %% [markdown]
@@ -216,4 +311,6 @@ v.Container(fluid=True, children=[
 ## Description
 
 This notebook computes the modulation transfer function (MTF) of an optical system and detector array.
+With defocus or spherical aberration (peak wavefront error at the edge of the pupil) the optics MTF is the autocorrelation of the aberrated pupil function.
+The composite MTF also includes Gaussian line-of-sight jitter and lateral carrier diffusion in the detector.
 """
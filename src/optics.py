@@ -14,57 +14,79 @@ import ipywidgets as widgets
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
-import scipy.special as sc
 
 from controls import (
+    ComputeScheduler,
     DetectorFormatControlPanel,
+    IncrementalFigure,
     OpticsControlPanel,
-    WavelengthsControlPanel
+    Parameters,
+    Throttle,
+    WavelengthsControlPanel,
+    profiling_panel,
+)
+from imaging import (
+    blur_spot_diameter,
+    encircled_energy_radius,
+    pixel_energy,
 )
 
 
-parameters = {
+parameters = Parameters({
     'diameter': 1,
     'focal_length': 2,
-    'fnumber': 2,
     'Hdim': 1280,
     'Vdim': 720,
     'pitch': 20,
     'wavelengths': [3.0, 5.0],
-}
+}, scheduler=ComputeScheduler())
 
+Npixels = 9
 
-output = widgets.Output()
 
+@parameters.derived(names=['diameter', 'focal_length'])
+def fnumber(diameter, focal_length):
+    return focal_length/diameter
 
-class Figure():
-    def __init__(self):
-        (fig, [ax1, ax2]) = plt.subplots(ncols=2, constrained_layout=True)
 
-        fig.canvas.header_visible = False
-        fig.canvas.toolbar_visible = True
-        fig.canvas.toolbar_position = 'right'
+# blur spot diameters in pixels
+@parameters.derived(names=['fnumber', 'pitch', 'wavelengths'])
+def blur_spots(fnumber, pitch, wavelengths):
+    return blur_spot_diameter(fnumber, np.array(wavelengths))/pitch
 
-        self.fig = fig
-        self.ax1 = ax1
-        self.ax2 = ax2
 
-        self.update()
+# energy collected by each of Npixels×Npixels pixels, PSF centred on the middle one
+@parameters.derived(names=['fnumber', 'pitch', 'wavelengths'])
+def pixel_energies(fnumber, pitch, wavelengths):
+    return [pixel_energy(fnumber, xx, pitch, neighbours=Npixels//2) for xx in wavelengths]
 
-    @property
-    def canvas(self):
-        return self.fig.canvas
 
-    def update(self):
-        Npixels = 9
-        fnumber = parameters['fnumber']
-        pitch = parameters['pitch']
-        xlambda = np.array(parameters['wavelengths'])
+@parameters.derived(names=['fnumber', 'pitch', 'wavelengths'])
+def ensquared_energy(fnumber, pitch, wavelengths):
+    return [pixel_energy(fnumber, xx, pitch, neighbours=0)[0, 0] for xx in wavelengths]
+
+
+@parameters.derived(names=['fnumber', 'pitch', 'wavelengths'])
+def band_ensquared_energy(fnumber, pitch, wavelengths):
+    band = np.linspace(np.min(wavelengths), np.max(wavelengths), 16)
+
+    return (band, pixel_energy(fnumber, band, pitch, neighbours=0)[0, 0])
 
-        blur_spots = 2*sc.jn_zeros(1, 1)[0]/np.pi*xlambda*fnumber/pitch
 
-        self.ax1.clear()
-        self.ax2.clear()
+@parameters.derived(names=['fnumber', 'wavelengths'])
+def encircled_energy_diameters(fnumber, wavelengths):
+    return 2*encircled_energy_radius(fnumber, np.array(wavelengths)[:, None], [0.5, 0.8, 0.84])
+
+
+output = widgets.Output()
+
+
+class Figure(IncrementalFigure):
+    def __init__(self):
+        (fig, [ax1, ax2]) = plt.subplots(ncols=2, constrained_layout=True)
+
+        self.ax1 = ax1
+        self.ax2 = ax2
 
         for ax in [self.ax1, self.ax2]:
             ax.set_aspect('equal')
@@ -75,37 +97,29 @@ class Figure():
             ax.set_axisbelow(True)
             ax.grid(True)
 
-        self.ax1.set_title(f'Blur spot = {blur_spots[0]*pitch:g} µm', color='red')
-        self.ax2.set_title(f'Blur spot = {blur_spots[1]*pitch:g} µm', color='blue')
+        super().__init__(fig)
 
-        circle1 = mpl.patches.Circle((0.5, 0.5), blur_spots[0]/Npixels/2, color='red', alpha=0.5, transform=self.ax1.transAxes)
-        circle2 = mpl.patches.Circle((0.5, 0.5), blur_spots[1]/Npixels/2, color='blue', alpha=0.5, transform=self.ax2.transAxes)
+    def update(self):
+        pitch = parameters['pitch']
+        blur_spots = parameters['blur_spots']
+        energies = parameters['pixel_energies']
+
+        for (idx, (ax, cmap, color)) in enumerate([(self.ax1, 'Reds', 'red'), (self.ax2, 'Blues', 'blue')]):
+            ax.set_title(f'Blur spot = {blur_spots[idx]*pitch:g} µm', color=color)
 
-        self.ax1.add_patch(circle1)
-        self.ax2.add_patch(circle2)
+            self.image(ax, ('energy', idx), energies[idx], [0, Npixels, 0, Npixels], cmap=cmap, vmin=0, origin='lower')
 
-        self.ax1.grid(True)
-        self.ax2.grid(True)
+            circle = self.artist(('blur_spot', idx), lambda: ax.add_patch(
+                mpl.patches.Circle((0.5, 0.5), 0, color=color, fill=False, linewidth=2, transform=ax.transAxes)
+            ))
+            circle.set_radius(blur_spots[idx]/Npixels/2)
 
-        self.fig.canvas.draw_idle()
+        self.draw()
 
 
 class Table():
     def __init__(self):
-        self.widget = v.Html(tag='div', class_='d-flex flex-row', children=[])
-
-        self.update()
-
-    def update(self):
-        fnumber = parameters['fnumber']
-        Hdim = parameters['Hdim']
-        Vdim = parameters['Vdim']
-        pitch = parameters['pitch']
-        xlambda = np.array(parameters['wavelengths'])
-
-        blur_spots = 2*sc.jn_zeros(1, 1)[0]/np.pi*xlambda*fnumber/pitch
-
-        table = v.DataTable(
+        self.table = v.DataTable(
             style_='width: 100%',
             hide_default_footer=True,
             disable_sort=True,
@@ -114,35 +128,73 @@ class Table():
                 {'text': 'Value', 'value': 'value'},
                 {'text': 'Units', 'value': 'units'},
             ],
-            items=[
-                {
-                    'parameter': 'Chip Width',
-                    'value': f'{Hdim*(pitch/1e3):g}',
-                    'units': 'mm',
-                },
-                {
-                    'parameter': 'Chip Height',
-                    'value': f'{Vdim*(pitch/1e3):g}',
-                    'units': 'mm',
-                },
-                {
-                    'parameter': 'Chip Area',
-                    'value': f'{Hdim*Vdim*(pitch/1e3)**2:g}',
-                    'units': 'mm²',
-                },
-                {
-                    'parameter': 'Blur Spot (Wavelength #1)',
-                    'value': f'{blur_spots[0]*pitch:g}',
-                    'units': 'µm',
-                },
-                {
-                    'parameter': 'Blur Spot (Wavelength #2)',
-                    'value': f'{blur_spots[1]*pitch:g}',
-                    'units': 'µm',
-                },
-            ],
+            items=[],
         )
-        self.widget.children = [table]
+        self.widget = v.Html(tag='div', class_='d-flex flex-row', children=[self.table])
+
+        self.update()
+
+    def update(self):
+        Hdim = parameters['Hdim']
+        Vdim = parameters['Vdim']
+        pitch = parameters['pitch']
+        blur_spots = parameters['blur_spots']
+        ensquared_energy = parameters['ensquared_energy']
+        (band, band_ensquared_energy) = parameters['band_ensquared_energy']
+        encircled_energy_diameters = parameters['encircled_energy_diameters']
+
+        self.table.items = [
+            {
+                'parameter': 'Chip Width',
+                'value': f'{Hdim*(pitch/1e3):g}',
+                'units': 'mm',
+            },
+            {
+                'parameter': 'Chip Height',
+                'value': f'{Vdim*(pitch/1e3):g}',
+                'units': 'mm',
+            },
+            {
+                'parameter': 'Chip Area',
+                'value': f'{Hdim*Vdim*(pitch/1e3)**2:g}',
+                'units': 'mm²',
+            },
+            {
+                'parameter': 'Blur Spot (Wavelength #1)',
+                'value': f'{blur_spots[0]*pitch:g}',
+                'units': 'µm',
+            },
+            {
+                'parameter': 'Blur Spot (Wavelength #2)',
+                'value': f'{blur_spots[1]*pitch:g}',
+                'units': 'µm',
+            },
+            {
+                'parameter': 'EE50 / EE80 / EE84 Diameter (Wavelength #1)',
+                'value': ' / '.join(f'{xx:.3g}' for xx in encircled_energy_diameters[0]),
+                'units': 'µm',
+            },
+            {
+                'parameter': 'EE50 / EE80 / EE84 Diameter (Wavelength #2)',
+                'value': ' / '.join(f'{xx:.3g}' for xx in encircled_energy_diameters[1]),
+                'units': 'µm',
+            },
+            {
+                'parameter': 'Ensquared Energy (Wavelength #1)',
+                'value': f'{100*ensquared_energy[0]:.1f}',
+                'units': '%',
+            },
+            {
+                'parameter': 'Ensquared Energy (Wavelength #2)',
+                'value': f'{100*ensquared_energy[1]:.1f}',
+                'units': '%',
+            },
+            {
+                'parameter': f'Ensquared Energy ({band[0]:g}–{band[-1]:g} µm)',
+                'value': f'{100*band_ensquared_energy:.1f}',
+                'units': '%',
+            },
+        ]
 
 
 plt.ioff()
@@ -163,28 +215,36 @@ detector_format_control_panel = DetectorFormatControlPanel(
 wavelengths_control_panel = WavelengthsControlPanel(xlambda=parameters['wavelengths'])
 
 
-def update():
-    figure.update()
-    table.update()
+parameters.observe(figure.update, names=['pitch', 'blur_spots', 'pixel_energies'])
+parameters.observe(table.update, names=[
+    'Hdim', 'Vdim', 'pitch', 'blur_spots', 'ensquared_energy', 'band_ensquared_energy', 'encircled_energy_diameters',
+])
+
+
+# coalesces events while a control is dragged, at most one redraw per 200 ms
+throttle = Throttle(interval=0.2)
 
 
+@throttle
 def update_optics():
-    parameters['diameter'] = optics_control_panel.diameter
-    parameters['focal_length'] = optics_control_panel.focal_length
-    parameters['fnumber'] = optics_control_panel.fnumber
-    update()
+    parameters.update({
+        'diameter': optics_control_panel.diameter,
+        'focal_length': optics_control_panel.focal_length,
+    })
 
 
+@throttle
 def update_detector_format():
-    parameters['Hdim'] = detector_format_control_panel.Hdim
-    parameters['Vdim'] = detector_format_control_panel.Vdim
-    parameters['pitch'] = float(detector_format_control_panel.pitch)
-    update()
+    parameters.update({
+        'Hdim': detector_format_control_panel.Hdim,
+        'Vdim': detector_format_control_panel.Vdim,
+        'pitch': detector_format_control_panel.pitch,
+    })
 
 
+@throttle
 def update_wavelengths():
-    parameters['wavelengths'] = wavelengths_control_panel.xlambda
-    update()
+    parameters.update({'wavelengths': wavelengths_control_panel.xlambda})
 
 
 optics_control_panel.on_change(update_optics)
@@ -249,6 +309,7 @@ v.Container(children=[
     #         output
     #     ]),
     # ]),
+    *profiling_panel(),
 ])
 
 # %%
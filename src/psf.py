@@ -14,89 +14,115 @@ import ipywidgets as widgets
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
-import scipy.special
 
 from controls import (
+    ComputeScheduler,
+    IncrementalFigure,
     OpticsControlPanel,
+    Parameters,
+    Throttle,
     WavelengthsControlPanel,
+    profiling_panel,
+)
+from imaging import (
+    airy_psf,
+    encircled_energy,
+    encircled_energy_radius,
 )
 
 
-parameters = {
+parameters = Parameters({
     'diameter': 1,
     'focal_length': 2,
     'wavelengths': [3, 5],
-}
+}, scheduler=ComputeScheduler())
+
+ENCIRCLED_ENERGY_FRACTIONS = [0.5, 0.8, 0.84]
+
 
+@parameters.derived(names=['diameter', 'focal_length'])
+def fnumber(diameter, focal_length):
+    return focal_length/diameter
 
-def psf(x):
-    return (2*scipy.special.jv(1, x)/x)**2
 
+@parameters.derived(names=['fnumber', 'wavelengths'])
+def encircled_energy_radii(fnumber, wavelengths):
+    return encircled_energy_radius(fnumber, np.array(wavelengths)[:, None], ENCIRCLED_ENERGY_FRACTIONS)
 
-class Figure():
+
+class Figure(IncrementalFigure):
     def __init__(self):
-        (fig, ax) = plt.subplots(constrained_layout=True)
+        (fig, (ax1, ax2)) = plt.subplots(nrows=2, sharex=True, constrained_layout=True)
+
+        self.ax1 = ax1
+        self.ax2 = ax2
+
+        self.ax1.set_ylabel(R'PSF')
+        self.ax1.set_yscale('log')
 
-        fig.canvas.header_visible = False
-        fig.canvas.toolbar_visible = True
-        fig.canvas.toolbar_position = 'right'
+        self.ax2.set_xlabel('Distance (µm)')
+        self.ax2.set_ylabel('Encircled Energy')
+        self.ax2.set_ylim([0, 1])
 
-        self.fig = fig
-        self.ax = ax
+        self.ax1.grid(True)
+        self.ax2.grid(True)
 
-        self.update()
+        for fraction in ENCIRCLED_ENERGY_FRACTIONS:
+            self.ax2.axhline(fraction, color='gray', linestyle=':', linewidth=1)
 
-    @property
-    def canvas(self):
-        return self.fig.canvas
+        super().__init__(fig)
 
     def update(self):
         self.plot()
 
-        self.ax.set_xlabel('Distance (µm)')
-        self.ax.set_ylabel(R'PSF')
-        self.ax.set_yscale('log')
+        self.autoscale(self.ax1, self.ax2)
 
-        self.ax.grid(True)
-
-        self.fig.canvas.draw_idle()
+        self.draw()
 
     def plot(self):
-        Da = parameters['diameter']
-        focal_length = parameters['focal_length']
-        xlambda = parameters['wavelengths']
-
-        self.ax.clear()
+        fnumber = parameters['fnumber']
+        xlambda = np.array(parameters['wavelengths'])
 
         uu = np.linspace(0.1, 10, 100)
+        xx = 1/np.pi * xlambda[:, None] * fnumber * uu
+        radii = parameters['encircled_energy_radii']
 
         for idx in range(len(xlambda)):
-            xx = 1/np.pi * xlambda[idx] * focal_length/Da * uu
-            self.ax.plot(xx, psf(uu))
+            self.line(self.ax1, ('psf', idx), xx[idx], airy_psf(uu))
+            self.line(self.ax2, ('encircled_energy', idx), xx[idx], encircled_energy(fnumber, xlambda[idx], xx[idx]))
+            self.line(self.ax2, ('radii', idx), radii[idx], ENCIRCLED_ENERGY_FRACTIONS, marker='o', linestyle='none', color=f'C{idx}')
 
 
 plt.ioff()
 
 figure = Figure()
 
+parameters.observe(figure.update, names=['fnumber', 'wavelengths', 'encircled_energy_radii'])
+
 optics_control_panel = OpticsControlPanel(diameter=parameters['diameter'], focal_length=parameters['focal_length'])
 wavelengths_control_panel = WavelengthsControlPanel(xlambda=parameters['wavelengths'])
 output = widgets.Output(layout={'border': '1px solid black'})
 
 
+# coalesces events while a control is dragged, at most one redraw per 250 ms
+throttle = Throttle(interval=0.25)
+
+
+@throttle
 # @output.capture()
 def update_optics():
-    parameters['diameter'] = optics_control_panel.diameter
-    parameters['focal_length'] = optics_control_panel.focal_length
+    parameters.update({
+        'diameter': optics_control_panel.diameter,
+        'focal_length': optics_control_panel.focal_length,
+    })
     # print(parameters, optics_control_panel.fnumber)
-    figure.update()
 
 
+@throttle
 # @output.capture()
 def update_wavelengths():
-    parameters['wavelengths'] = wavelengths_control_panel.xlambda
+    parameters.update({'wavelengths': wavelengths_control_panel.xlambda})
     # print(parameters)
-    figure.update()
 
 
 optics_control_panel.on_change(update_optics)
@@ -142,6 +168,7 @@ v.Container(fluid=True, children=[
     #         output
     #     ]),
     # ]),
+    *profiling_panel(),
 ])
 
 
@@ -150,4 +177,5 @@ v.Container(fluid=True, children=[
 ## Description
 
 This notebook computes the point spread function associated with a given optical chain.
+The encircled energy of the Airy pattern follows Rayleigh's closed form 1 − J0²(x) − J1²(x), with x = πr/(λ·f/#); the dots mark the radii enclosing 50%, 80% and 84% of the energy.
 """
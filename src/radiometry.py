@@ -0,0 +1,165 @@
+import math
+
+import numpy as np
+import scipy.special
+
+from atmosphere import (
+    TransmissionTable,
+    band_weights,
+)
+
+
+# First and second radiation constants (CIE 15:2004), matching colour-science.
+C1 = 3.741771e-16  # W m²
+C2 = 1.4388e-2  # m K
+
+# ∫_0^∞ x³/(eˣ-1) dx
+PLANCK_INTEGRAL_TOTAL = np.pi**4/15
+
+# Below this point the Planck integral is evaluated with its Bernoulli series,
+# above it with the exponential series; 14 and 16 terms respectively keep the
+# truncation error below 1e-13 (relative) on either side of the split.
+_SERIES_SPLIT = 2.0
+_BERNOULLI_POWERS = np.arange(0, 15)
+_BERNOULLI_COEFFS = np.array([1/3] + [
+    scipy.special.bernoulli(2*k)[2*k]/math.factorial(2*k)/(2*k+3)
+    for k in range(1, 15)
+])
+_EXPONENTIAL_TERMS = np.arange(1, 17)
+
+
+def _bernoulli_series(x):
+    # (G(0) - G(x))/x³, where G is the Planck integral below; valid for x < 2π
+    return np.sum(_BERNOULLI_COEFFS*(x**2)[..., None]**_BERNOULLI_POWERS, axis=-1) - x/8
+
+
+def planck_integral(x):
+    # ∫_x^∞ t³/(eᵗ-1) dt, vectorized over x ≥ 0 (x = ∞ is allowed)
+    x = np.asarray(x, dtype=float)
+    small = x < _SERIES_SPLIT
+
+    xs = np.where(small, x, 0.0)
+    head = xs**3*_bernoulli_series(xs)
+
+    xl = np.clip(np.where(small, _SERIES_SPLIT, x), None, 700.0)[..., None]
+    nn = _EXPONENTIAL_TERMS
+    nx = nn*xl
+    tail = np.sum(np.exp(-nx)*(((nx + 3)*nx + 6)*nx + 6)/nn**4, axis=-1)
+
+    return np.where(small, PLANCK_INTEGRAL_TOTAL-head, np.where(x < 700.0, tail, 0.0))
+
+
+def blackbody_spectral_radiant_sterance(temperature, wavelength):
+    # Planck's law in W cm⁻² µm⁻¹ sr⁻¹ for temperature (K) and wavelength (µm),
+    # broadcast against each other. Written in terms of e⁻ˣ so that large
+    # x = C2/(λT) underflows to zero instead of overflowing exp().
+    temperature = np.asarray(temperature, dtype=float)
+    wavelength = np.asarray(wavelength, dtype=float)*1e-6
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        xx = C2/(wavelength*temperature)
+        radiance = C1/np.pi*wavelength**-5*np.exp(-xx)/-np.expm1(-xx)
+
+    return np.where(wavelength > 0, radiance, 0.0)/1e6/1e4
+
+
+def band_radiant_sterance(temperature, spectral_bands, method='series'):
+    # In-band radiant sterance (W cm⁻² sr⁻¹) of a blackbody, for every
+    # temperature (K) × spectral band (µm) pair; returns shape T.shape + (Nbands,).
+    # method='table' trades exactness for speed by interpolating the
+    # fractional blackbody table (see below) instead of summing the series.
+    temperature = np.asarray(temperature, dtype=float)[..., None]
+    spectral_bands = np.asarray(spectral_bands, dtype=float).reshape((-1, 2))
+    lambda_min = spectral_bands[:, 0]*1e-6
+    lambda_max = spectral_bands[:, 1]*1e-6
+
+    with np.errstate(divide='ignore'):
+        xx = C2/(np.stack([lambda_max, lambda_min])*temperature[..., None, :])
+
+    scale = C1/np.pi*(temperature/C2)**4/1e4
+    if method == 'series':
+        integral = planck_integral(xx)
+    elif method == 'table':
+        integral = _planck_integral_table(xx)
+    else:
+        raise ValueError(f'Unknown method: {method!r}')
+
+    return scale*(integral[..., 0, :] - integral[..., 1, :])
+
+
+# Fractional blackbody function F(0→λT) = G(x)/G(0), with x = C2/(λT) and
+# G the Planck integral above, tabulated once at import on a uniform grid in x
+# (h = 0.002, 2 × 15001 doubles). Above x = 3 the table holds ln G; below it,
+# where band differences of G cancel, it holds (G(0) - G(x))/x³ instead.
+# Linear interpolation is bounded by h²/8·max|f''/f| ≈ 1e-7 relative error on
+# either quantity, so a band [λ1, λ2] is accurate to ≈ 1e-7·(G1 + G2)/(G1 - G2),
+# i.e. ~1e-7 for broad bands, growing like λ/Δλ for narrow ones. Beyond x = 30
+# the first term of the exponential series is exact to better than 1e-13.
+_TABLE_X = np.linspace(0, 30, 15001)
+_TABLE_SPLIT = 3.0
+_TABLE_LOG_G = np.log(planck_integral(_TABLE_X))
+_TABLE_H = np.where(
+    _TABLE_X < _SERIES_SPLIT,
+    _bernoulli_series(np.minimum(_TABLE_X, _SERIES_SPLIT)),
+    (PLANCK_INTEGRAL_TOTAL - planck_integral(_TABLE_X))/np.maximum(_TABLE_X, _SERIES_SPLIT)**3,
+)
+
+
+def _planck_integral_table(x):
+    x = np.asarray(x, dtype=float)
+    xl = np.clip(x, _TABLE_X[-1], 700.0)
+    tail = np.where(x < 700.0, np.exp(-xl)*(((xl + 3)*xl + 6)*xl + 6), 0.0)
+    head = np.where(
+        x < _TABLE_SPLIT,
+        PLANCK_INTEGRAL_TOTAL - x**3*np.interp(x, _TABLE_X, _TABLE_H),
+        np.exp(np.interp(x, _TABLE_X, _TABLE_LOG_G)),
+    )
+
+    return np.where(x <= _TABLE_X[-1], head, tail)
+
+
+def fractional_blackbody(lambda_temperature):
+    # F(0→λT), the fraction of the total blackbody exitance below λ (λT in µm K)
+    with np.errstate(divide='ignore'):
+        xx = C2*1e6/np.asarray(lambda_temperature, dtype=float)
+
+    return _planck_integral_table(xx)/PLANCK_INTEGRAL_TOTAL
+
+
+def apparent_band_radiant_sterance(temperature, model, range, haze, spectral_bands, *, altitude=None, table=None, chunk_size=1024):
+    # In-band radiant sterance (W cm⁻² sr⁻¹) of a blackbody seen through the
+    # LOWTRAN7 path given by (model, range, haze, altitude), i.e. ∫ τ(λ) L(λ, T) dλ per
+    # band; path radiance is not included. The range may lie anywhere between
+    # the tabulated ones (see TransmissionTable.spectrum). The scenario
+    # arguments broadcast against each other and the result has shape
+    # broadcast + (Nbands,). Work is done in chunks of scenarios, restricted to
+    # the wavelengths that the bands cover, so cost and memory scale linearly
+    # with the scenario count.
+    if table is None:
+        table = TransmissionTable.load()
+
+    if altitude is None:
+        altitude = table.altitudes[0]
+
+    (temperature, model, range, haze, altitude) = np.broadcast_arrays(temperature, model, range, haze, altitude)
+    shape = temperature.shape
+    (temperature, model, range, haze, altitude) = (xx.ravel() for xx in (temperature, model, range, haze, altitude))
+
+    weights = band_weights(table.xlambda, spectral_bands)
+    support = np.flatnonzero(np.any(weights != 0, axis=0))
+    (start, stop) = (support.min(), support.max()+1) if len(support) else (0, 0)
+    weights = weights[:, start:stop]
+
+    # the table restricted to those wavelengths (a view of its columns)
+    table = TransmissionTable(
+        table.xlambda[start:stop], table.Tcoeff[:, start:stop],
+        models=table.models, ranges=table.ranges, haze_types=table.haze_types, altitudes=table.altitudes,
+    )
+
+    values = np.empty((len(temperature), len(weights)))
+    for lo in np.arange(0, len(temperature), chunk_size):
+        hi = lo + chunk_size
+        radiance = blackbody_spectral_radiant_sterance(temperature[lo:hi, None], table.xlambda)
+        values[lo:hi] = (radiance*table.spectrum(model[lo:hi], range[lo:hi], haze[lo:hi], altitude[lo:hi])) @ weights.T
+
+    return values.reshape(shape + (len(weights),))
@@ -0,0 +1,9 @@
+import pathlib
+import sys
+
+
+# the libraries in src/, and the LOWTRAN driver as lowtran.lowtran7 (the
+# notebook src/lowtran7.py has the same module name)
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'src'))
@@ -0,0 +1,108 @@
+import io
+
+import numpy as np
+import pytest
+
+from atmosphere import (
+    _export_csv,
+    _format_fixed,
+    TransmissionTable,
+    band_average,
+    band_weights,
+    convolve_slit,
+    cumulative_integral,
+    response_weights,
+    slit_function,
+)
+
+
+def test_format_fixed_matches_printf():
+    # values on and around the decimal ties, where the scaling rounds across
+    rng = np.random.default_rng(0)
+    values = np.concatenate([
+        np.round(rng.uniform(0, 1, 100000)*2e6)/2e6,
+        rng.uniform(0, 1, 10000),
+        [0.0, 1.0, 0.2500005, 0.0000005, 0.9999995, 0.1234565],
+    ])
+
+    formatted = _format_fixed(values, 6).view('S8').ravel()
+    expected = np.array([b'%.6f' % xx for xx in values])
+
+    assert np.array_equal(formatted, expected)
+
+
+def test_export_csv_matches_savetxt():
+    rng = np.random.default_rng(0)
+    xlambda = np.linspace(0.2, 25, 3000)
+    Tcoeff = np.round(rng.uniform(0, 1, (3, 3000))*2e6)/2e6
+    cases = {'model': [1, 2, 6], 'range': [0.5, 1, 50], 'haze': [0, 1, 5], 'altitude': [0.0, 0.0, 0.0]}
+
+    with io.BytesIO() as buffer:
+        np.savetxt(buffer, np.column_stack([xlambda, Tcoeff.T]), fmt=['%.4f'] + ['%.6f']*3, delimiter=',', newline='\r\n')
+        expected = buffer.getvalue()
+
+    assert b''.join(list(_export_csv(xlambda, Tcoeff, cases, chunk_size=512))[1:]) == expected
+
+
+def test_band_average_matches_band_weights():
+    # LOWTRAN7 wavelengths (ascending, uniform in wavenumber) and bands that
+    # are broad, narrower than a bin, on a sample or past the ends of the table
+    rng = np.random.default_rng(0)
+    xlambda = 1e4/np.linspace(50000, 400, 9921)
+    Tcoeff = rng.uniform(0, 1, (3, len(xlambda)))
+    spectral_bands = [[3, 5], [8, 12], [0.2, 30], [10.0, 10.001], [xlambda[100], xlambda[200]], [0.1, 0.3], [20, 40]]
+
+    averages = band_average(xlambda, Tcoeff, cumulative_integral(xlambda, Tcoeff), spectral_bands)
+
+    clipped = np.clip(spectral_bands, xlambda[0], xlambda[-1])
+    expected = Tcoeff @ band_weights(xlambda, spectral_bands).T/(clipped[:, 1] - clipped[:, 0])
+
+    np.testing.assert_allclose(averages, expected, rtol=1e-10)
+
+
+@pytest.mark.parametrize(('slit', 'fwhm'), [('triangular', 20.0), ('triangular', 7.5), ('gaussian', 20.0), ('gaussian', 3.0)])
+def test_convolve_slit_matches_convolve(slit, fwhm):
+    rng = np.random.default_rng(0)
+    Tcoeff = rng.uniform(0, 1, (3, 2000))
+    kernel = slit_function(slit, fwhm, 5.0)
+    half = len(kernel)//2
+
+    assert np.isclose(np.sum(kernel), 1)
+    assert np.allclose(kernel, kernel[::-1])
+
+    expected = [np.convolve(np.pad(xx, half, mode='edge'), kernel, mode='valid') for xx in Tcoeff]
+
+    np.testing.assert_allclose(convolve_slit(Tcoeff, kernel), expected, rtol=0, atol=1e-12)
+
+
+def test_slit_function_rejects_unknown_slit():
+    with pytest.raises(ValueError):
+        slit_function('boxcar', 20.0, 5.0)
+
+
+def test_response_average_of_unit_sum_response():
+    # the weights of any response sum to one, so a flat spectrum averages to
+    # itself and a response within a band sees the band's transmission
+    rng = np.random.default_rng(0)
+    xlambda = 1e4/np.linspace(50000, 400, 9921)
+    wavelength = np.linspace(3, 5, 41)
+    responses = [np.ones(41), np.hanning(41), rng.uniform(0, 1, 41)]
+
+    weights = response_weights(xlambda, wavelength, responses)
+    np.testing.assert_allclose(np.sum(weights, axis=-1), 1, rtol=1e-14)
+    assert np.all(weights[:, (xlambda < 3) | (xlambda > 5)] == 0)
+
+    Tcoeff = np.full((2, len(xlambda)), 0.25, dtype=np.float32)
+    Tcoeff[1] = np.where((xlambda > 2.5) & (xlambda < 5.5), 0.75, 0.0)
+    table = TransmissionTable(xlambda, Tcoeff, models=np.array([1, 2]), ranges=np.array([1]), haze_types=np.array([0]))
+
+    np.testing.assert_allclose(table.response_average(wavelength, responses), [[0.25]*3, [0.75]*3], rtol=1e-6)
+
+
+def test_response_weights_rejects_zero_response():
+    xlambda = 1e4/np.linspace(50000, 400, 9921)
+
+    with pytest.raises(ValueError, match=r'\[1\]'):
+        response_weights(xlambda, np.linspace(3, 5, 41), [np.ones(41), np.zeros(41)])
+    with pytest.raises(ValueError):
+        response_weights(xlambda, [40, 50], [1, 1])
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from controls import ComputeScheduler, DetectorFormatControlPanel, Parameters, Throttle
+
+
+def test_detector_format_ignores_invalid_input():
+    panel = DetectorFormatControlPanel(Hdim=1280, Vdim=720, pitch=20.0)
+    changes = []
+    panel.on_change(lambda: changes.append((panel.Hdim, panel.Vdim, panel.pitch)))
+
+    for data in ['', '  ', 'abc', '12x', '0', '-3', 'nan', 'inf', None]:
+        panel.update_parameters('Hdim', None, 'input', data)
+        panel.update_parameters('pitch', None, 'input', data)
+
+    assert (panel.Hdim, panel.Vdim, panel.pitch) == (1280, 720, 20.0)
+    assert changes == []
+
+
+def test_detector_format_clamps_to_limits():
+    panel = DetectorFormatControlPanel(Hdim=1280, Vdim=720, pitch=20.0)
+
+    panel.update_parameters('Hdim', None, 'input', '640')
+    panel.update_parameters('Vdim', None, 'input', '99999')
+    panel.update_parameters('pitch', None, 'input', '1')
+    assert (panel.Hdim, panel.Vdim, panel.pitch) == (640, 12288, 2.0)
+    assert isinstance(panel.Hdim, int) and isinstance(panel.pitch, float)
+
+    panel.update_parameters('Vdim', None, 'input', '480.4')
+    panel.update_parameters('pitch', None, 'input', '500')
+    assert (panel.Vdim, panel.pitch) == (480, 120.0)
+
+    panel.update_parameters('pitch', None, 'input', '12.5')
+    assert panel.pitch == 12.5
+
+
+async def settle(scheduler, timeout=5.0):
+    # Waits for the background job of scheduler, if any, to be applied
+    deadline = time.monotonic() + timeout
+    while scheduler._future is not None and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0)
+
+
+def test_scheduler_burst_shows_last_value():
+    parameters = Parameters({'x': 0}, scheduler=ComputeScheduler())
+    (computed, applied, seen) = ([], [], [])
+
+    @parameters.derived(names=['x'])
+    def slow(x):
+        computed.append(x)
+        time.sleep(0.05)
+        return 10*x
+
+    parameters.observe(lambda: seen.append(parameters['slow']), names=['slow'])
+
+    apply = parameters._apply
+    parameters._apply = lambda memo: (applied.append(memo['slow']), apply(memo))
+
+    async def burst():
+        # the first job is running on the worker when the others are submitted
+        parameters.update({'x': 1})
+        await asyncio.sleep(0.01)
+        for x in range(2, 6):
+            parameters.update({'x': x})
+            await asyncio.sleep(0)
+        await settle(parameters.scheduler)
+
+    asyncio.run(burst())
+
+    # the running job completes but its result is dropped, the queued ones
+    # never start
+    assert computed == [1, 5]
+    assert applied == [50]
+    assert seen == [50]
+    assert (parameters['x'], parameters['slow']) == (5, 50)
+
+
+def test_throttle_burst_runs_first_and_last():
+    throttle = Throttle(interval=0.05)
+    calls = []
+
+    @throttle
+    def handler(x):
+        calls.append(x)
+
+    async def burst():
+        for x in range(10):
+            handler(x)
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.2)
+
+    asyncio.run(burst())
+
+    assert calls == [0, 9]
@@ -0,0 +1,122 @@
+import itertools
+
+import numpy as np
+import pytest
+import scipy.integrate
+
+from imaging import (
+    AIRY_FIRST_ZERO,
+    MTF_TERMS,
+    aberrated_mtf,
+    airy_psf,
+    blur_spot_diameter,
+    composite_mtf,
+    encircled_energy,
+    encircled_energy_radius,
+    ensquared_energy,
+    mtf_terms,
+    optics_mtf,
+    pixel_energy,
+    polychromatic_psf,
+)
+
+
+# extremes of the optics notebook controls: f/# from 0.1/10 to 10/0.1,
+# wavelengths from 0.2 to 30 µm and pixel pitch from 2 to 120 µm
+@pytest.mark.parametrize(('fnumber', 'xlambda', 'pitch'), itertools.product([0.01, 1, 2, 100], [0.2, 3, 30], [2, 20, 100, 120]))
+def test_pixel_energy_block_holds_at_most_the_psf(fnumber, xlambda, pitch):
+    for (neighbours, offset) in [(0, (0.0, 0.0)), (4, (0.0, 0.0)), (4, (pitch/2, -pitch/3))]:
+        # up to the round-off of the sum
+        assert pixel_energy(fnumber, xlambda, pitch, neighbours=neighbours, offset=offset).sum() <= 1 + 1e-12
+
+
+def test_pixel_energy_block_wider_than_psf_grid():
+    # the 9×9 block (1080 µm) is wider than the 576 µm PSF grid at f/1, 3 µm
+    np.testing.assert_allclose(pixel_energy(1, 3, 120, neighbours=4).sum(), 1, atol=1e-5)
+
+
+@pytest.mark.parametrize(('fnumber', 'xlambda', 'pitch'), [(2, 3, 20), (4, 4, 10), (1, 10, 30), (8, 5, 15)])
+def test_pixel_energy_matches_airy_ensquared_energy(fnumber, xlambda, pitch):
+    np.testing.assert_allclose(pixel_energy(fnumber, xlambda, pitch, neighbours=0)[0, 0], ensquared_energy(fnumber, xlambda, pitch), atol=1e-3)
+
+
+# bands of the optics notebook, sampled as in band_ensquared_energy, up to
+# the full range of the wavelength sliders
+@pytest.mark.parametrize(('fnumber', 'band', 'pitch'), itertools.product([0.01, 1, 2, 100], [(0.2, 30), (0.2, 0.4), (3, 5), (8, 12), (25, 30)], [2, 20, 50, 120]))
+def test_band_pixel_energy_matches_weighted_airy_ensquared_energy(fnumber, band, pitch):
+    xlambda = np.linspace(*band, 16)
+    weights = np.linspace(1, 3, 16)
+
+    # the residual is that of single wavelengths whose PSF grid, 128·λ·f/#
+    # across, is about as wide as the pixel
+    expected = np.average(ensquared_energy(fnumber, xlambda, pitch), weights=weights)
+    np.testing.assert_allclose(pixel_energy(fnumber, xlambda, pitch, weights, neighbours=0)[0, 0], expected, atol=5e-3)
+
+
+def test_polychromatic_psf_splits_wide_bands():
+    components = polychromatic_psf(2, np.linspace(0.2, 30, 16))
+
+    assert len(components) == 5
+    assert np.all(np.diff([spacing for (spacing, psf) in components]) > 0)
+    np.testing.assert_allclose(sum(np.sum(psf) for (spacing, psf) in components), 1)
+
+
+@pytest.mark.parametrize('xx', [0.1, 1, 2, AIRY_FIRST_ZERO*np.pi, 7, 10, 30])
+def test_encircled_energy_matches_quad(xx):
+    # the Airy PSF (2·J1(u)/u)² integrates to 2 over u·du
+    (expected, _) = scipy.integrate.quad(lambda uu: airy_psf(uu)*uu/2, 0, xx, epsabs=0, epsrel=1e-12, limit=200)
+
+    np.testing.assert_allclose(encircled_energy(1, 1, xx/np.pi), expected, rtol=1e-9)
+
+
+def test_encircled_energy_in_first_dark_ring():
+    for (fnumber, xlambda) in [(1, 1), (2, 4), (8, 10)]:
+        np.testing.assert_allclose(encircled_energy(fnumber, xlambda, blur_spot_diameter(fnumber, xlambda)/2), 0.8378, atol=5e-5)
+
+
+@pytest.mark.parametrize(('fnumber', 'xlambda'), [(1, 1), (2, 4), (0.5, 30)])
+def test_encircled_energy_radius_round_trips(fnumber, xlambda):
+    fraction = np.concatenate([np.linspace(0, 0.99, 991), [0.5, 0.8, 0.84, 0.9936], np.logspace(-12, -3, 10)])
+    radius = encircled_energy_radius(fnumber, xlambda, fraction)
+
+    assert np.all(np.diff(radius[:991]) > 0)
+    np.testing.assert_allclose(encircled_energy(fnumber, xlambda, radius), fraction, rtol=0, atol=1e-6)
+
+
+def test_encircled_energy_radius_beyond_table():
+    radius = encircled_energy_radius(2, 4, [0.9937, 0.995, 1.0, 1.5])
+
+    assert np.all(np.isnan(radius))
+
+
+@pytest.mark.parametrize(('fnumber', 'xlambda'), [(1, 1), (2, 4), (4, 10), (0.5, 30)])
+def test_aberrated_mtf_without_aberrations_is_diffraction_limited(fnumber, xlambda):
+    # up to the sampling of the pupil (128 points across)
+    freq = np.linspace(0, 1.2, 241)/(xlambda*fnumber)
+
+    np.testing.assert_allclose(aberrated_mtf(freq, fnumber, xlambda), optics_mtf(fnumber, xlambda, freq), rtol=0, atol=1e-3)
+
+
+def test_aberrated_mtf_degrades_with_defocus():
+    # defocus in µm of wavefront error at λ = 4 µm: 0, λ/8, λ/4, λ/2
+    freq = np.linspace(0, 1, 101)/8
+    mtf = aberrated_mtf(freq, 2, 4, defocus=np.array([0, 0.5, 1, 2])[:, None])
+
+    assert np.all(np.diff(mtf[:, 1:-1], axis=0) < 0)
+    np.testing.assert_allclose(mtf[:, 0], 1)
+
+
+def test_composite_mtf_is_product_of_terms():
+    freq = np.linspace(0, 0.25, 51)
+    parameters = {
+        'fnumber': np.array([[2.0], [4.0]]), 'xlambda': 4.0, 'pitch': 20.0, 'defocus': 0.5, 'spherical': 0.2,
+        'jitter': 2.0, 'smear': 5.0, 'diffusion_length': 10.0, 'crosstalk': 0.05,
+    }
+    terms = [name for name in MTF_TERMS if name != 'diffraction']
+
+    values = mtf_terms(freq, terms, **parameters)
+    assert list(values) == terms
+    np.testing.assert_allclose(values['pixel'], np.abs(np.sinc(freq*20.0)))
+
+    np.testing.assert_allclose(composite_mtf(freq, terms, **parameters), np.prod(np.broadcast_arrays(*values.values()), axis=0), rtol=1e-14)
+    assert composite_mtf(freq, terms, **parameters).shape == (2, 51)
@@ -0,0 +1,62 @@
+import gzip
+import pathlib
+
+import numpy as np
+import pytest
+
+from lowtran import lowtran7
+
+
+# The first and the last case of the LOWTRAN7 table as written by LOWTRAN
+# (Tropical, 0.5 km, no haze; 1976 US Standard, 50 km, urban haze)
+SAMPLE = pathlib.Path(__file__).parent / 'data' / 'TAPE7.gz'
+
+
+def test_read_TAPE7_matches_loadtxt(tmp_path):
+    path = tmp_path / 'TAPE7'
+    path.write_bytes(gzip.decompress(SAMPLE.read_bytes()))
+
+    data = lowtran7.read_TAPE7(path, 2)
+
+    assert data.shape == (2, lowtran7.Npts, len(lowtran7.columns))
+    assert np.array_equal(data, lowtran7.read_TAPE7_loadtxt(path, 2))
+    assert np.array_equal(data[:, :, 0], np.broadcast_to(lowtran7.xnu, (2, lowtran7.Npts)))
+
+
+def test_iter_TAPE7_reads_one_case_at_a_time(tmp_path):
+    path = tmp_path / 'TAPE7'
+    path.write_bytes(gzip.decompress(SAMPLE.read_bytes()))
+
+    cases = lowtran7.iter_TAPE7(path, 2)
+    first = next(cases)
+    assert first.shape == (lowtran7.Npts, len(lowtran7.columns))
+    assert np.array_equal([first, *cases], lowtran7.read_TAPE7(path, 2))
+
+    with pytest.raises(ValueError):
+        list(lowtran7.iter_TAPE7(path, 3))
+
+
+@pytest.mark.parametrize(('Ncases', 'jobs'), [(0, 4), (3, 8), (10, 4), (64, 1), (65, 1), (5000, 8)])
+def test_split_shards(Ncases, jobs):
+    cases = np.arange(4*Ncases).reshape((Ncases, 4))
+    shards = lowtran7.split_shards(cases, jobs)
+
+    assert all(0 < len(shard) <= lowtran7.SHARD_SIZE for shard in shards)
+    assert len(shards) >= min(jobs, Ncases)
+    assert np.array_equal(np.concatenate(shards) if shards else cases, cases)
+
+
+def test_store_keeps_the_cases_parsed_before_a_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(lowtran7, 'cache', tmp_path / 'cache')
+    cases = lowtran7.parameters[:3]
+
+    def data():
+        yield np.ones((lowtran7.Npts, len(lowtran7.columns)))
+        raise RuntimeError('LOWTRAN output truncated')
+
+    with pytest.raises(RuntimeError):
+        lowtran7.store(cases, data())
+
+    assert [path.name for path in lowtran7.cache.iterdir()] == [f'{lowtran7.case_key(cases[0])}.npz']
+    with np.load(lowtran7.cache / f'{lowtran7.case_key(cases[0])}.npz') as case_data:
+        assert np.array_equal(case_data['data'], np.ones((lowtran7.Npts, len(lowtran7.columns))))
@@ -0,0 +1,102 @@
+import colour
+import numpy as np
+import pytest
+import scipy.integrate
+
+from atmosphere import (
+    TransmissionTable,
+    band_weights,
+)
+from radiometry import (
+    apparent_band_radiant_sterance,
+    band_radiant_sterance,
+    blackbody_spectral_radiant_sterance,
+)
+
+
+# the temperature slider of the blackbody notebook spans 0 to 3000 K
+TEMPERATURES = [0, 1, 10, 50, 100, 300, 500, 1000, 2000, 3000]
+
+# broad, narrow and far-tail bands (µm)
+SPECTRAL_BANDS = [[3, 5], [8, 12], [0.2, 30], [1, 1.5], [4.0, 4.01], [10.0, 10.001], [0.2, 0.3], [25, 30]]
+
+
+def reference(temperature, band):
+    if temperature == 0:
+        return 0.0
+
+    return scipy.integrate.quad(
+        lambda xx: float(blackbody_spectral_radiant_sterance(temperature, xx)), *band,
+        epsabs=0, epsrel=1e-13, limit=200,
+    )[0]
+
+
+# relative accuracy of each method, which degrades like λ/Δλ for narrow
+# bands where the difference of the Planck integrals cancels
+@pytest.mark.parametrize(('method', 'rtol'), [('series', 1e-13), ('table', 2e-7)])
+def test_band_radiant_sterance_matches_quad(method, rtol):
+    radiances = band_radiant_sterance(TEMPERATURES, SPECTRAL_BANDS, method=method)
+
+    for (temperature, row) in zip(TEMPERATURES, radiances):
+        for (band, radiance) in zip(SPECTRAL_BANDS, row):
+            tolerance = rtol*max(1, np.mean(band)/(band[1] - band[0]))
+            np.testing.assert_allclose(radiance, reference(temperature, band), rtol=tolerance, atol=1e-300, err_msg=f'{temperature} K, {band} µm')
+
+
+@pytest.mark.parametrize('method', ['series', 'table'])
+def test_band_radiant_sterance_at_zero_kelvin(method):
+    assert np.all(band_radiant_sterance(0, SPECTRAL_BANDS, method=method) == 0)
+
+
+def test_spectral_radiant_sterance_matches_colour():
+    # over the sliders of the blackbody notebook; colour divides by zero at
+    # 0 K and returns W m⁻² m⁻¹ sr⁻¹ for every wavelength × temperature pair
+    temperature = np.array(TEMPERATURES[1:], dtype=float)
+    wavelength = np.linspace(0.2, 30, 300)
+
+    with np.errstate(over='ignore'):
+        expected = colour.colorimetry.blackbody_spectral_radiance(wavelength*1e-6, temperature)/1e6/1e4
+
+    np.testing.assert_allclose(blackbody_spectral_radiant_sterance(temperature, wavelength[:, None]), expected, rtol=1e-12, atol=1e-300)
+
+
+def beer_lambert_table():
+    # Table of T = exp(-k(λ)·R) on the LOWTRAN7 wavenumber grid, for which the
+    # optical-depth interpolation between ranges is exact
+    xlambda = 1e4/np.linspace(50000, 400, 9921)
+    (models, ranges, haze_types) = (np.array([1, 2]), np.array([0.5, 1, 2, 5, 10]), np.array([0, 5]))
+    kk = 0.1*(1 + np.sin(xlambda))*np.array([1, 2])[:, None, None, None]*np.array([1, 3])[None, None, :, None]
+
+    return (kk, TransmissionTable(
+        xlambda, np.exp(-kk*ranges[:, None, None]).reshape((-1, len(xlambda))).astype(np.float32),
+        models=models, ranges=ranges, haze_types=haze_types,
+    ))
+
+
+def test_apparent_band_radiant_sterance_at_tabulated_ranges():
+    (_, table) = beer_lambert_table()
+    cases = table.cases
+    temperature = np.linspace(250, 1500, len(cases['model']))
+
+    spectra = table.spectrum(cases['model'], cases['range'], cases['haze'])
+    assert np.array_equal(spectra, table.Tcoeff)
+
+    radiances = apparent_band_radiant_sterance(temperature, cases['model'], cases['range'], cases['haze'], SPECTRAL_BANDS[:4], table=table, chunk_size=7)
+    expected = (blackbody_spectral_radiant_sterance(temperature[:, None], table.xlambda)*table.Tcoeff) @ band_weights(table.xlambda, SPECTRAL_BANDS[:4]).T
+
+    np.testing.assert_allclose(radiances, expected, rtol=1e-12)
+
+
+def test_apparent_band_radiant_sterance_sweeps_range():
+    (kk, table) = beer_lambert_table()
+    ranges = np.linspace(0.5, 10, 40)
+
+    radiances = apparent_band_radiant_sterance(500, 2, ranges, 5, [[3, 5], [8, 12]], table=table)
+    transmission = np.exp(-kk[1, 0, 1]*ranges[:, None])
+    expected = (blackbody_spectral_radiant_sterance(500, table.xlambda)*transmission) @ band_weights(table.xlambda, [[3, 5], [8, 12]]).T
+
+    np.testing.assert_allclose(radiances, expected, rtol=1e-5)
+    assert np.all(np.diff(radiances, axis=0) < 0)
+
+    with pytest.raises(ValueError):
+        apparent_band_radiant_sterance(500, 2, 20, 5, [[3, 5]], table=table)